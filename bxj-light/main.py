@@ -1,36 +1,396 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import json
 import time
 import os
+import re
+import sqlite3
+import sys
+import threading
+import urllib.parse
 import requests
 from bs4 import BeautifulSoup
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+if lxml is not None:
+    # 先取出帖子列表，再在每个 li 内直接取发帖日期和帖子链接
+    POST_LIST = lxml.etree.XPath('//ul[contains(concat(" ", normalize-space(@class), " "), " for-list ")]')
+    POST_DATE = lxml.etree.XPath('string((.//div[contains(concat(" ", normalize-space(@class), " "), " author ")]//a[not(@class)])[1])')
+    POST_TITLE = lxml.etree.XPath('string((.//div[contains(concat(" ", normalize-space(@class), " "), " titlelink ")]//a[contains(concat(" ", normalize-space(@class), " "), " truetit ")])[1])')
+    POST_HREF = lxml.etree.XPath('string((.//div[contains(concat(" ", normalize-space(@class), " "), " titlelink ")]//a[contains(concat(" ", normalize-space(@class), " "), " truetit ")])[1]/@href)')
+
+
+class post_index(object):
+    # 本地帖子索引：posts 保存每个帖子的日期和标题，pages 保存各页的 ETag/Last-Modified ，
+    # boards 记录各板块从 covered_from 起的帖子都已收录，以及最近一次完整抓取的日期 crawled_on
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS posts (board TEXT, id TEXT, date TEXT, title TEXT, PRIMARY KEY (board, id));
+            CREATE INDEX IF NOT EXISTS posts_by_date ON posts (board, date);
+            CREATE TABLE IF NOT EXISTS pages (board TEXT, page INTEGER, etag TEXT, last_modified TEXT, PRIMARY KEY (board, page));
+            CREATE TABLE IF NOT EXISTS boards (board TEXT PRIMARY KEY, covered_from TEXT, crawled_on TEXT);
+        ''')
+
+    def known(self, board, ids):
+        ids = list(ids)
+        rows = self.db.execute('SELECT id FROM posts WHERE board = ? AND id IN ({})'.format(','.join('?' * len(ids))), [board] + ids)
+        return set(row[0] for row in rows)
+
+    def add(self, board, posts):
+        self.db.executemany('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)', [(board, post_id, post_date, title) for post_id, post_date, title in posts])
+
+    def posts_of_date(self, board, date):
+        return [row[0] for row in self.db.execute('SELECT id FROM posts WHERE board = ? AND date = ? ORDER BY CAST(id AS INTEGER) DESC', (board, date))]
+
+    def validators(self, board):
+        return {page: (etag, last_modified) for page, etag, last_modified in self.db.execute('SELECT page, etag, last_modified FROM pages WHERE board = ?', (board,))}
+
+    def save_validators(self, board, validators):
+        self.db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', [(board, page, etag, last_modified) for page, (etag, last_modified) in validators.items()])
+
+    def coverage(self, board):
+        row = self.db.execute('SELECT covered_from, crawled_on FROM boards WHERE board = ?', (board,)).fetchone()
+        return row if row else (None, None)
+
+    def set_coverage(self, board, covered_from, crawled_on):
+        self.db.execute('INSERT OR REPLACE INTO boards VALUES (?, ?, ?)', (board, covered_from, crawled_on))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class host_limiter(object):
+    # 每个 host 每秒最多 rate 个请求：记录每个 host 下一个请求最早可以发出的时间，在锁外等待
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = {}
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time.get(host, now))
+            self.next_time[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
 
 class lights(object):
 
-    def __init__(self):
-        self.block = 'bxj'
+    def __init__(self, base_url='https://bbs.hupu.com', workers=8, max_pages=100, index=None, block='bxj', rate=None, fixtures=None, record=False):
+        self.block = block
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.max_pages = max_pages
+        self.index = post_index(index) if index else None
+        # 每个 host 每秒最多 rate 个请求，None 表示不限制
+        self.limiter = host_limiter(rate) if rate else None
+        # 各 (板块, 页号) 上次响应的 (ETag, Last-Modified)，conditional 为 True 时用于条件请求
+        self.validators = {}
+        # fixtures 目录保存录好的页面：record 为 False 时只从目录读取、不访问网络，为 True 时下载并保存到目录
+        self.fixtures = fixtures
+        self.record = record
+        # 所有请求共用一个 session ；列表页和帖子页可能同时各有 workers 个在下载
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers * 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-    def get_post_id_by_date(self, date=None):
-        posts_of_date = []
+    # 返回 (状态码, 响应头, 内容)；离线时没有录好的页面按 404 处理
+    def get_text(self, path, headers=None):
+        filename = os.path.join(self.fixtures, urllib.parse.quote(path.lstrip('/'), safe='')) if self.fixtures else None
+        if filename and not self.record:
+            if not os.path.exists(filename):
+                return 404, {}, ''
+            with open(filename, encoding='utf-8') as f:
+                return 200, {}, f.read()
+        url = self.base_url + path
+        if self.limiter is not None:
+            self.limiter.wait(urllib.parse.urlsplit(url).netloc)
+        resp = self.session.get(url, headers=headers, timeout=10)
+        resp.encoding = 'utf-8'
+        if filename and resp.status_code == 200:
+            os.makedirs(self.fixtures, exist_ok=True)
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(resp.text)
+        return resp.status_code, resp.headers, resp.text
+
+    # 返回页面内容；conditional 为 True 且页面没有变化（304）时返回 None
+    def fetch_page(self, i, conditional=False, block=None):
+        block = block or self.block
+        headers = {}
+        etag, last_modified = self.validators.get((block, i), (None, None))
+        if conditional and etag:
+            headers['If-None-Match'] = etag
+        if conditional and last_modified:
+            headers['If-Modified-Since'] = last_modified
+        status, response_headers, text = self.get_text('/{}-{}'.format(block, i), headers)
+        if status == 304:
+            return None
+        if 'ETag' in response_headers or 'Last-Modified' in response_headers:
+            self.validators[(block, i)] = (response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        return text
+
+    # 帖子的第 n 页：第一页是 /ID.html ，之后是 /ID-n.html
+    def fetch_post_page(self, post_id, n):
+        status, headers, text = self.get_text('/{}.html'.format(post_id) if n == 1 else '/{}-{}.html'.format(post_id, n))
+        if status != 200:
+            raise requests.HTTPError('{} page {}: HTTP {}'.format(post_id, n, status))
+        return text
+
+    # 依次下载 post_ids 中每个帖子的全部页面，帖子的所有页都下载完后返回 {id, body, replies, pages}（出错时为 {id, error}），按完成顺序返回；
+    # 帖子按需从 post_ids 中取出，同时最多处理 in_flight 个帖子、最多有 workers 页在下载，调用方不再迭代时就不再下载
+    def iter_contents(self, post_ids, in_flight=None):
+        in_flight = in_flight or self.workers * 2
+        post_ids = iter(post_ids)
+        posts = {}
+        queue = collections.deque()
+        running = {}
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            try:
+                while True:
+                    while len(posts) < in_flight:
+                        post_id = next(post_ids, None)
+                        if post_id is None:
+                            break
+                        if post_id not in posts:
+                            posts[post_id] = {'texts': {}, 'left': 1, 'error': None}
+                            queue.append((post_id, 1))
+                    while queue and len(running) < self.workers:
+                        post_id, n = queue.popleft()
+                        running[executor.submit(self.fetch_post_page, post_id, n)] = (post_id, n)
+                    if not running:
+                        break
+                    finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        post_id, n = running.pop(future)
+                        state = posts[post_id]
+                        state['left'] -= 1
+                        if future.exception() is not None:
+                            state['error'] = state['error'] or str(future.exception())
+                        else:
+                            state['texts'][n] = future.result()
+                            if n == 1:
+                                count = post_page_count(post_id, state['texts'][1])
+                                queue.extend((post_id, i) for i in range(2, count + 1))
+                                state['left'] += count - 1
+                        if state['left'] == 0:
+                            del posts[post_id]
+                            yield {'id': post_id, 'error': state['error']} if state['error'] else parse_post(post_id, state['texts'])
+            finally:
+                for future in running:
+                    future.cancel()
+
+    # 返回一页中每个帖子的 (id, 发帖日期, 标题)；优先用 lxml 的 XPath 直接取值，没有 lxml 或页面解析不了、没有帖子列表时退回 BeautifulSoup ；没有标题链接或发帖日期的 li 两种方法都跳过
+    def parse_page(self, text):
+        posts = parse_page_fast(text) if lxml is not None else None
+        return posts if posts is not None else self.parse_page_soup(text)
+
+    def parse_page_soup(self, text):
+        soup = BeautifulSoup(text, 'lxml')
+        post_list = soup.find('ul', class_='for-list')
+        if post_list is None:
+            return []
+        posts = []
+        for item in post_list.find_all('li'):
+            title = item.select_one('div.titlelink a.truetit')
+            date = item.select_one('div.author a:not([class])')
+            # 广告等没有标题链接或发帖日期的 li 跳过
+            if title is None or not title.get('href') or date is None or not date.text:
+                continue
+            posts.append((title['href'][1:-5], date.text, title.text))
+        return posts
+
+    # 按页号顺序返回每页的帖子列表，同时最多有 workers 页在下载；调用方不再迭代时停止提交新的页；条件请求得到 304 的页为 None
+    def iter_pages(self, conditional=False, block=None):
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            pending = collections.deque(executor.submit(self.fetch_page, i, conditional, block) for i in range(1, min(self.workers, self.max_pages) + 1))
+            next_page = len(pending) + 1
+            try:
+                while pending:
+                    text = pending.popleft().result()
+                    if next_page <= self.max_pages:
+                        pending.append(executor.submit(self.fetch_page, next_page, conditional, block))
+                        next_page += 1
+                    yield None if text is None else self.parse_page(text)
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def get_post_id_by_date(self, date=None, block=None):
+        block = block or self.block
         target_date = get_today_date() if not date else date
-        target_date = '-'.join([target_date[:4], target_date[4:6], target_date[6:]])
-        for i in range(1, 2):
-            url = 'https://bbs.hupu.com/{}-{}'.format(self.block, i)
-            resp = requests.get(url)
-            resp.encoding = 'utf-8'
-            soup = BeautifulSoup(resp.text, 'lxml')
-            page_posts = soup.find('ul', class_='for-list').find_all('li')
-            if len(page_posts) == 0:
+        if self.index is not None:
+            return self.get_post_id_by_date_indexed(format_date(target_date), block)
+        return [post_id for post_block, post_id, post_date in self.iter_posts([(block, target_date, target_date)])]
+
+    # 批量查询：queries 为若干 (板块, 起始日期, 结束日期)，日期格式 YYYYMMDD ；
+    # 同一板块的查询合并成一次抓取，每页只下载一次，直到遇到空页或整页的帖子都早于该板块最早的起始日期；
+    # 各板块共用 workers 个下载线程，每次提交页号最小的板块的下一页；
+    # 每个板块按页号顺序依次返回 (板块, 帖子 id, 发帖日期)，同一帖子只返回一次
+    def iter_posts(self, queries):
+        ranges = collections.defaultdict(list)
+        for block, begin, end in queries:
+            ranges[block].append((format_date(begin), format_date(end)))
+        boards = {block: {'next': 1, 'stop': self.max_pages, 'emit': 1, 'done': {}, 'oldest': min(begin for begin, end in r)} for block, r in ranges.items()}
+        seen = set()
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            running = {}
+            try:
+                while True:
+                    while len(running) < self.workers:
+                        waiting = [block for block, state in boards.items() if state['next'] <= state['stop']]
+                        if not waiting:
+                            break
+                        block = min(waiting, key=lambda x: boards[x]['next'])
+                        running[executor.submit(self.fetch_page, boards[block]['next'], False, block)] = (block, boards[block]['next'])
+                        boards[block]['next'] += 1
+                    if not running:
+                        break
+                    finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        block, i = running.pop(future)
+                        state = boards[block]
+                        if i > state['stop']:
+                            continue
+                        page_posts = self.parse_page(future.result())
+                        state['done'][i] = page_posts
+                        # 空页或整页的帖子都早于最早的起始日期，后面的页不会再有要找的帖子
+                        if len(page_posts) == 0 or all(post_date < state['oldest'] for post_id, post_date, title in page_posts):
+                            state['stop'] = i
+                        while state['emit'] <= state['stop'] and state['emit'] in state['done']:
+                            for post_id, post_date, title in state['done'].pop(state['emit']):
+                                if (block, post_id) not in seen and any(begin <= post_date <= end for begin, end in ranges[block]):
+                                    seen.add((block, post_id))
+                                    yield block, post_id, post_date
+                            state['emit'] += 1
+            finally:
+                for future in running:
+                    future.cancel()
+
+    # 有本地索引时：已经过去且已完整收录的日期直接从索引回答；否则抓取并写入索引，
+    # 如果目标日期已在收录范围内，就用条件请求，并在遇到页面没有变化或整页帖子都已收录时停止
+    # （帖子按回复时间排序，被顶起的旧帖会出现在前面，所以不能在第一个已收录的帖子处就停止）
+    def get_post_id_by_date_indexed(self, target_date, block):
+        today = format_date(get_today_date())
+        covered_from, crawled_on = self.index.coverage(block)
+        covered = covered_from is not None and covered_from <= target_date
+        if covered and target_date < crawled_on:
+            return self.index.posts_of_date(block, target_date)
+        self.validators.update(((block, page), value) for page, value in self.index.validators(block).items())
+        complete = False
+        for page_posts in self.iter_pages(covered, block):
+            if page_posts is None or len(page_posts) == 0:
+                complete = covered or page_posts is not None
+                break
+            known = self.index.known(block, (post_id for post_id, post_date, title in page_posts))
+            self.index.add(block, page_posts)
+            if all(post_date < target_date for post_id, post_date, title in page_posts):
+                complete = True
                 break
-            posts_of_date = list(filter(lambda x: x.find('div', class_='author').find('a', class_=False).text == target_date, page_posts))
-            posts_of_date = list(map(lambda x: x.find('div', class_='titlelink').find('a', class_='truetit')['href'][1:-5], posts_of_date))
-        return posts_of_date
+            if covered and len(known) == len(page_posts):
+                complete = True
+                break
+        self.index.save_validators(block, {page: value for (page_block, page), value in self.validators.items() if page_block == block})
+        if complete:
+            self.index.set_coverage(block, covered_from if covered else target_date, today)
+        self.index.commit()
+        return self.index.posts_of_date(block, target_date)
+
+def parse_page_fast(text):
+    try:
+        root = lxml.html.fromstring(text)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+    post_list = POST_LIST(root)
+    if not post_list:
+        return None
+    posts = []
+    for item in post_list[0].iter('li'):
+        href, date = POST_HREF(item), POST_DATE(item)
+        if not href or not date:
+            continue
+        posts.append((href[1:-5], date, POST_TITLE(item)))
+    return posts
+
+# 帖子页里翻页链接中最大的页号
+def post_page_count(post_id, text):
+    return max([1] + [int(n) for n in re.findall(r'/{}-(\d+)\.html'.format(re.escape(str(post_id))), text)])
+
+# 从帖子的各页中取出主楼正文和各楼回复的文字
+def parse_post(post_id, texts):
+    body = ''
+    replies = []
+    for n in sorted(texts):
+        soup = BeautifulSoup(texts[n], 'lxml')
+        main = soup.find(id='tpc')
+        if main is not None and main.find('div', class_='quote-content') is not None:
+            body = body or main.find('div', class_='quote-content').get_text('\n', strip=True)
+        for floor in soup.find_all('div', class_='floor'):
+            box = floor.find('div', class_='floor_box')
+            if floor.get('id') == 'tpc' or box is None:
+                continue
+            content = box.find('td') or box
+            replies.append(content.get_text('\n', strip=True))
+    return {'id': post_id, 'body': body, 'replies': replies, 'pages': len(texts)}
 
 def get_today_date():
     return time.strftime('%Y%m%d')
 
+# YYYYMMDD 转成页面上的 YYYY-MM-DD
+def format_date(date):
+    return '-'.join([date[:4], date[4:6], date[6:]])
+
 if __name__ == '__main__':
-    l = lights()
-    l.get_post_id_by_date()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('date', nargs='?', help='YYYYMMDD, today by default')
+    parser.add_argument('--until', help='YYYYMMDD, query every date from date to until')
+    parser.add_argument('--board', nargs='+', default=['bxj'])
+    parser.add_argument('--base-url', default='https://bbs.hupu.com')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--max-pages', type=int, default=100)
+    parser.add_argument('--rate', type=float, help='requests per second per host')
+    parser.add_argument('--index', help='sqlite file that keeps an incremental post index')
+    parser.add_argument('--content', action='store_true', help='fetch every post with its replies and write JSON lines')
+    parser.add_argument('--output', default='-', help='where to write the JSON lines')
+    parser.add_argument('--fixtures', help='directory of recorded pages to read instead of the network')
+    parser.add_argument('--record', action='store_true', help='fetch from the network and save pages into --fixtures')
+    args = parser.parse_args()
+    if args.index and args.until:
+        parser.error('--index answers one date at a time and cannot be used with --until')
+    if args.record and not args.fixtures:
+        parser.error('--record needs --fixtures')
+
+    l = lights(args.base_url, args.workers, args.max_pages, args.index, rate=args.rate, fixtures=args.fixtures, record=args.record)
+    date = args.date or get_today_date()
+    if l.index is not None:
+        results = ((board, post_id) for board in args.board for post_id in l.get_post_id_by_date(date, board))
+    else:
+        results = ((board, post_id) for board, post_id, post_date in l.iter_posts([(board, date, args.until or date) for board in args.board]))
+    if args.content:
+        # 帖子 id 边抓取边交给 iter_contents ，每下载完一个帖子就写出一行
+        with open(args.output, 'w', encoding='utf-8') if args.output != '-' else contextlib.nullcontext(sys.stdout) as f:
+            for record in l.iter_contents(post_id for board, post_id in results):
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+    else:
+        for board, post_id in results:
+            print(post_id if len(args.board) == 1 else '{} {}'.format(board, post_id))
+    if l.index is not None:
+        l.index.close()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import itertools
+import sys
+import time
+import numpy as np
+from sudoku import Sudoku, SolutionCache, UNITS, CELL_UNITS, ALL_NOMINEES, MASK_COUNT, ENGINES, read_puzzles, write_puzzles
+
+UNITS_ARRAY = np.array(UNITS, dtype=np.intp)
+CELL_UNITS_ARRAY = np.array(CELL_UNITS, dtype=np.intp)
+DIGIT_BITS = (1 << np.arange(9)).astype(np.uint16)
+# 数字到掩码、单一掩码到数字、掩码到候选数个数的查找表
+VALUE_BIT = np.array([0] + [1 << n for n in range(9)], dtype=np.uint16)
+BIT_VALUE = np.zeros(ALL_NOMINEES + 1, dtype=np.uint8)
+BIT_VALUE[VALUE_BIT[1:]] = np.arange(1, 10)
+POPCOUNT = np.array(MASK_COUNT, dtype=np.uint8)
+
+def plains_to_values(plains):
+    return (np.frombuffer(''.join(plains).replace('.', '0').encode(), dtype=np.uint8) - ord('0')).reshape(-1, 81)
+
+def values_to_plains(values):
+    raw = (values + ord('0')).astype(np.uint8).tobytes().decode()
+    return [raw[i:i + 81] for i in range(0, len(raw), 81)]
+
+# 对 N 个盘面同时做显性唯一数（kill_nominees）和隐性唯一数（unique_nominee）推理，直到没有盘面再有变化
+# 返回每个盘面的状态：1 为已完成，-1 为出现矛盾，0 为需要继续搜索
+def propagate(values, masks):
+    status = np.zeros(len(values), dtype=np.int8)
+    active = np.arange(len(values))
+    while len(active):
+        v = values[active]
+        m = masks[active]
+        unit_values = v[:, UNITS_ARRAY]
+        unit_placed = np.bitwise_or.reduce(VALUE_BIT[unit_values], axis=2)
+        cell_placed = np.bitwise_or.reduce(unit_placed[:, CELL_UNITS_ARRAY], axis=2)
+        m &= ~cell_placed
+        m[v > 0] = 0
+        # 矛盾：unit 内有重复数，unit 内有数字既没有填入也没有 cell 可填，或者有空 cell 没有候选数
+        duplicate = ((unit_values > 0).sum(axis=2) != POPCOUNT[unit_placed]).any(axis=1)
+        missing = ((np.bitwise_or.reduce(m[:, UNITS_ARRAY], axis=2) | unit_placed) != ALL_NOMINEES).any(axis=1)
+        empty = ((v == 0) & (m == 0)).any(axis=1)
+        contradiction = duplicate | missing | empty
+        solved = (v > 0).all(axis=1) & ~contradiction
+        open_grids = ~(contradiction | solved)
+
+        # 显性唯一数
+        single = (v == 0) & (POPCOUNT[m] == 1) & open_grids[:, None]
+        v[single] = BIT_VALUE[m[single]]
+        # 隐性唯一数：某个 unit 内只有一个 cell 拥有某个候选数
+        candidates = (m[:, :, None] & DIGIT_BITS) != 0
+        unit_candidates = candidates[:, UNITS_ARRAY, :]
+        hidden = (unit_candidates.sum(axis=2) == 1) & open_grids[:, None, None]
+        grid, unit, digit = np.nonzero(hidden)
+        position = unit_candidates.argmax(axis=2)[grid, unit, digit]
+        v[grid, UNITS_ARRAY[unit, position]] = digit + 1
+
+        changed = (v != values[active]).any(axis=1)
+        values[active] = v
+        masks[active] = m
+        status[active[solved]] = 1
+        status[active[contradiction]] = -1
+        active = active[changed & open_grids]
+    return status
+
+# 求解一批盘面，返回 (解, result) 列表、唯一数推理解出的个数和超时的个数；只靠唯一数推理停滞的盘面先查 cache ，没有再交给 Sudoku.solve() 继续搜索，每个盘面最多 time_limit 秒
+def solve_batch(plains, engine='strategy', cache=None, time_limit=None):
+    values = plains_to_values(plains)
+    masks = np.full(values.shape, ALL_NOMINEES, dtype=np.uint16)
+    status = propagate(values, masks)
+    solutions = values_to_plains(values)
+    results = [bool(x) for x in status == 1]
+    timed_out = 0
+    for index in np.nonzero(status == 0)[0]:
+        solution = None if cache is None else cache.lookup(plains[index])
+        if solution is not None:
+            solutions[index], results[index] = solution, True
+            continue
+        s = Sudoku()
+        s.read_plain(solutions[index])
+        results[index] = s.solve(engine, time_limit=time_limit)
+        solutions[index] = s.plain_sudoku()
+        timed_out += int(not results[index] and s.search_stats['timeout'])
+        if results[index] and cache is not None:
+            cache.save(plains[index], solutions[index])
+    return list(zip(solutions, results)), int((status == 1).sum()), timed_out
+
+# 检查一批盘面的解的个数（最多数到 limit 个）：唯一数推理解出的盘面只有一个解，出现矛盾的无解，其余的在推理后的盘面上交给 Sudoku.count_solutions()
+def validate_batch(plains, engine='strategy', limit=2):
+    values = plains_to_values(plains)
+    masks = np.full(values.shape, ALL_NOMINEES, dtype=np.uint16)
+    status = propagate(values, masks)
+    partials = values_to_plains(values)
+    counts = [int(x == 1) for x in status]
+    for index in np.nonzero(status == 0)[0]:
+        s = Sudoku()
+        s.read_plain(partials[index])
+        counts[index] = s.count_solutions(limit, engine)
+    return counts
+
+def verdict(count):
+    return 'unsolvable' if count == 0 else 'unique' if count == 1 else 'multiple'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--engine', choices=ENGINES, default='strategy', help='engine for puzzles that singles alone cannot solve')
+    parser.add_argument('--chunk', type=int, default=10000, help='number of puzzles propagated together')
+    parser.add_argument('--mmap', action='store_true', help='read files through mmap')
+    parser.add_argument('--output', default='-', help='where to write solutions')
+    parser.add_argument('--cache', help='dbm file that keeps solutions across runs')
+    parser.add_argument('--cache-size', type=int, default=0, help='solutions kept in memory; the cache is off unless this or --cache is given')
+    parser.add_argument('--time-limit', type=float, help='seconds allowed per searched puzzle before the search gives up')
+    parser.add_argument('--validate', action='store_true', help='count solutions instead of solving and write only puzzles with a unique solution')
+    args = parser.parse_args()
+
+    if args.validate:
+        verdicts = {'unsolvable': 0, 'unique': 0, 'multiple': 0}
+        def unique_puzzles():
+            puzzles = (plain for f in args.files for plain in read_puzzles(f, args.mmap))
+            while True:
+                chunk = list(itertools.islice(puzzles, args.chunk))
+                if not chunk:
+                    break
+                for plain, count in zip(chunk, validate_batch(chunk, args.engine)):
+                    verdicts[verdict(count)] += 1
+                    if count == 1:
+                        yield plain
+        begin_time = time.time()
+        write_puzzles(args.output, unique_puzzles())
+        end_time = time.time()
+        total = sum(verdicts.values())
+        print('{unique} unique, {multiple} multiple, {unsolvable} unsolvable, {0} puzzles/s.'.format(round(total / max(end_time - begin_time, 1e-9), 1), **verdicts), file=sys.stderr)
+        sys.exit()
+
+    cache = SolutionCache(args.cache_size, args.cache) if args.cache_size > 0 or args.cache else None
+    summary = {'count': 0, 'solved': 0, 'singles': 0, 'timeout': 0}
+    def solutions():
+        puzzles = (plain for f in args.files for plain in read_puzzles(f, args.mmap))
+        while True:
+            chunk = list(itertools.islice(puzzles, args.chunk))
+            if not chunk:
+                break
+            solved, singles, timed_out = solve_batch(chunk, args.engine, cache, args.time_limit)
+            summary['count'] += len(chunk)
+            summary['singles'] += singles
+            summary['timeout'] += timed_out
+            for plain, result in solved:
+                summary['solved'] += int(result)
+                yield plain
+    begin_time = time.time()
+    write_puzzles(args.output, solutions())
+    end_time = time.time()
+    print('{0}/{1} Sudokus solved, {2} by singles alone, {3} timed out, {4} puzzles/s.'.format(summary['solved'], summary['count'], summary['singles'], summary['timeout'], round(summary['count'] / max(end_time - begin_time, 1e-9), 1)), file=sys.stderr)
+    if cache is not None:
+        if cache.hits:
+            print('{0} of {1} searched puzzles answered from the solution cache.'.format(cache.hits, cache.hits + cache.misses), file=sys.stderr)
+        cache.close()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from sudoku import Sudoku, Killer, read_puzzles
+from generator import shuffle_grid, random_grid, remove_clues, unique_layout
+
+# 各难度的目标提示数，0 表示一直删到不能再删（最小盘面）
+GRADES = {'easy': 38, 'medium': 30, 'hard': 0}
+# 已知的 17 提示数盘面，生成时对它们做等价变换
+SEVENTEEN_CLUES = [
+    '000000010400000000020000000000050407008000300001090000300400200050100000000806000',
+    '000000010400000000020000000000050604008000300001090000300400200050100000000807000',
+    '000000012000035000000600070700000300000400800100000000000120000080000040050000600',
+    '000000012003600000000007000410020000000500300700000600280000040000300500000000000',
+    '000000012008030000000000040120500000000004700060000000507000300000620000000100000',
+    '000000012040050000000009000070600400000100000000000050000087500601000300200000000',
+]
+CORPUS_FILES = ['easy', 'medium', 'hard', '17-clue', 'killer']
+
+def generate(directory, count, seed):
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    corpus = {name: [] for name in CORPUS_FILES}
+    for i in range(count):
+        for grade, target in GRADES.items():
+            corpus[grade].append(remove_clues(random_grid(rnd), rnd, target))
+        corpus['17-clue'].append(shuffle_grid(rnd.choice(SEVENTEEN_CLUES), rnd))
+        corpus['killer'].append(unique_layout(rnd))
+    for name, puzzles in corpus.items():
+        with open(os.path.join(directory, name + '.txt'), 'w') as f:
+            f.write('\n'.join(puzzles) + '\n')
+
+# 各求解路径：输入一行盘面，返回是否解出
+def path_whole_solve(plain):
+    s = Sudoku()
+    s.read_plain(plain)
+    s.whole_solve()
+    return s.get_unsolved_count() == 0 and s.check_sudoku()
+
+def path_attempt(plain):
+    s = Sudoku()
+    s.read_plain(plain)
+    return s.solve('strategy', search=True)
+
+def path_dlx(plain):
+    s = Sudoku()
+    s.read_plain(plain)
+    return s.solve('dlx')
+
+def path_k_whole_solve(layout):
+    k = Killer()
+    k.read_cages(layout)
+    k.k_whole_solve()
+    return k.get_unsolved_count() == 0 and k.check_sudoku()
+
+def path_killer_solve(layout):
+    k = Killer()
+    k.read_cages(layout)
+    return k.solve()
+
+PATHS = {
+    'whole_solve': (path_whole_solve, ['easy', 'medium', 'hard', '17-clue']),
+    'attempt': (path_attempt, ['easy', 'medium', 'hard', '17-clue']),
+    'dlx': (path_dlx, ['easy', 'medium', 'hard', '17-clue']),
+    'k_whole_solve': (path_k_whole_solve, ['killer']),
+    'killer_solve': (path_killer_solve, ['killer']),
+}
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+# 对一组盘面先预热 warmup 个，再重复 repeats 遍计时，最后单独跑一遍用 tracemalloc 记录峰值内存
+def measure(method, puzzles, repeats, warmup):
+    for puzzle in puzzles[:warmup]:
+        method(puzzle)
+    samples = []
+    solved = 0
+    for r in range(repeats):
+        for puzzle in puzzles:
+            begin_time = time.perf_counter()
+            result = method(puzzle)
+            samples.append(time.perf_counter() - begin_time)
+            if r == 0:
+                solved += int(result)
+    tracemalloc.start()
+    for puzzle in puzzles:
+        method(puzzle)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    ordered = sorted(samples)
+    return {
+        'puzzles': len(puzzles),
+        'solved': solved,
+        'p50': percentile(ordered, 50),
+        'p90': percentile(ordered, 90),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1],
+        'mean': sum(samples) / len(samples),
+        'puzzles_per_sec': len(samples) / sum(samples),
+        'peak_memory': peak,
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark(directory, repeats, warmup, paths):
+    results = {}
+    for name in paths:
+        method, corpora = PATHS[name]
+        results[name] = {}
+        for corpus in corpora:
+            filename = os.path.join(directory, corpus + '.txt')
+            if corpus == 'killer':
+                with open(filename) as f:
+                    puzzles = [line.strip() for line in f if line.strip()]
+            else:
+                puzzles = list(read_puzzles(filename))
+            results[name][corpus] = measure(method, puzzles, repeats, warmup)
+            print('{0:>14} {1:>8}: p50 {p50:.4f} s, p99 {p99:.4f} s, {puzzles_per_sec:.1f} puzzles/s, {solved}/{puzzles} solved, peak {peak_memory} B'.format(name, corpus, **results[name][corpus]), file=sys.stderr)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'repeats': repeats,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+# 和之前保存的结果比较 p50 ，变慢超过 threshold 的记为回归
+def compare(baseline, current, threshold):
+    regressions = []
+    for name, corpora in current['results'].items():
+        for corpus, result in corpora.items():
+            old = baseline['results'].get(name, {}).get(corpus)
+            if old is None:
+                continue
+            ratio = result['p50'] / old['p50'] if old['p50'] else 1.0
+            print('{0:>14} {1:>8}: p50 {2:.4f} -> {3:.4f} s ({4:+.1%})'.format(name, corpus, old['p50'], result['p50'], ratio - 1))
+            if ratio > 1 + threshold:
+                regressions.append((name, corpus))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    generate_parser = commands.add_parser('generate', help='generate a graded corpus')
+    generate_parser.add_argument('directory')
+    generate_parser.add_argument('--count', type=int, default=20, help='puzzles per grade')
+    generate_parser.add_argument('--seed', type=int, default=0)
+    run_parser = commands.add_parser('run', help='benchmark every solver path on a corpus')
+    run_parser.add_argument('directory')
+    run_parser.add_argument('--repeats', type=int, default=3)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    run_parser.add_argument('--output', help='save results as JSON')
+    run_parser.add_argument('--compare', help='JSON results of an earlier run')
+    run_parser.add_argument('--threshold', type=float, default=0.1, help='allowed p50 slowdown before reporting a regression')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate(args.directory, args.count, args.seed)
+    elif args.command == 'run':
+        current = benchmark(args.directory, args.repeats, args.warmup, args.paths)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                regressions = compare(json.load(f), current, args.threshold)
+            if regressions:
+                print('Regressions: {0}'.format(regressions))
+                sys.exit(1)
+    else:
+        parser.print_help()
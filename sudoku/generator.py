@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import contextlib
+import multiprocessing
+import random
+import sys
+import time
+from sudoku import Sudoku, Killer, write_puzzles
+
+# 评级用到的求值方法，由易到难；attempt 表示推理解不出、需要搜索
+RATINGS = ['kill_nominees', 'unique_nominee', 'pointing_pair', 'box_line_reduction', 'number_chain', 'x_wing', 'y_wing', 'xyz_wing', 'swordfish', 'attempt']
+# 各等级允许用到的最难的求值方法
+GRADES = {'easy': 'unique_nominee', 'medium': 'number_chain', 'hard': 'swordfish', 'expert': 'attempt'}
+
+# 等价变换：数字重新编号、band/stack 内外的行列交换以及转置
+def shuffle_grid(plain, rnd):
+    digits = list('123456789')
+    rnd.shuffle(digits)
+    relabel = dict(zip('123456789', digits))
+    relabel['0'] = '0'
+    rows = [band * 3 + r for band in rnd.sample(range(3), 3) for r in rnd.sample(range(3), 3)]
+    columns = [stack * 3 + c for stack in rnd.sample(range(3), 3) for c in rnd.sample(range(3), 3)]
+    grid = [[plain[r * 9 + c] for c in columns] for r in rows]
+    if rnd.random() < 0.5:
+        grid = [list(x) for x in zip(*grid)]
+    return ''.join(relabel[x] for row in grid for x in row)
+
+# 第一行随机排列后用 Dancing Links 补全，再做一次等价变换
+def random_grid(rnd):
+    digits = list(range(1, 10))
+    rnd.shuffle(digits)
+    s = Sudoku()
+    s.fill_numbers(digits + [0] * 72)
+    s.dlx_solve()
+    return shuffle_grid(s.plain_sudoku(), rnd)
+
+# 按随机顺序删除提示数，只有删除后仍然唯一解（且 accept 不为 None 时 accept(盘面) 为真）才真正删除，直到剩下 target 个提示数
+def remove_clues(solution, rnd, target=0, accept=None):
+    puzzle = list(solution)
+    order = list(range(81))
+    rnd.shuffle(order)
+    for index in order:
+        if 81 - puzzle.count('0') <= target:
+            break
+        kept, puzzle[index] = puzzle[index], '0'
+        s = Sudoku()
+        s.read_plain(''.join(puzzle))
+        if s.count_solutions(2, 'dlx') != 1 or (accept is not None and not accept(''.join(puzzle))):
+            puzzle[index] = kept
+    return ''.join(puzzle)
+
+# 把完整盘面随机切分成相连且数字不重复的 cage ，输出 Killer.read_cages() 的格式
+def killer_layout(solution, rnd, max_size=5):
+    free = set(range(81))
+    order = list(range(81))
+    rnd.shuffle(order)
+    cages = []
+    for start in order:
+        if start not in free:
+            continue
+        cage = [start]
+        free.discard(start)
+        size = rnd.randint(1, max_size)
+        while len(cage) < size:
+            digits = set(solution[x] for x in cage)
+            neighbours = [n for x in cage for n in (x - 9, x + 9, x - 1 if x % 9 else -1, x + 1 if x % 9 < 8 else -1) if n in free and solution[n] not in digits]
+            if not neighbours:
+                break
+            n = rnd.choice(neighbours)
+            cage.append(n)
+            free.discard(n)
+        cages.append(cage)
+    return ''.join('{0}{{{1}}}'.format(sum(int(solution[x]) for x in cage), ','.join('{0}{1}'.format(x % 9 + 1, x // 9 + 1) for x in cage)) for cage in cages)
+
+# 按照求解时用到的最难的求值方法评级：whole_solve() 中确实去除过候选数或填入过数字的方法才算用到，推理解不出时为 attempt
+def rate(s):
+    s.whole_solve()
+    if s.get_unsolved_count() != 0:
+        return 'attempt'
+    used = [name for name in RATINGS if name in s.profile and (s.profile[name]['eliminated'] or s.profile[name]['placed'])]
+    return used[-1] if used else RATINGS[0]
+
+# 评级对应的等级：允许用到该评级的等级中最容易的一个
+def grade_of(rating):
+    return min((grade for grade in GRADES if RATINGS.index(rating) <= RATINGS.index(GRADES[grade])), key=lambda x: RATINGS.index(GRADES[x]))
+
+def rate_plain(plain):
+    s = Sudoku()
+    s.read_plain(plain)
+    return rate(s)
+
+def rate_layout(layout):
+    k = Killer()
+    k.read_cages(layout)
+    return rate(k)
+
+# 生成一个指定等级的盘面：删除提示数时保证评级不超过该等级，删到不能再删后评级恰好等于该等级才返回，否则换一个完整盘面重来
+def generate_plain(grade, rnd):
+    hardest = RATINGS.index(GRADES[grade])
+    accept = None if GRADES[grade] == 'attempt' else lambda plain: RATINGS.index(rate_plain(plain)) <= hardest
+    while True:
+        puzzle = remove_clues(random_grid(rnd), rnd, accept=accept)
+        rating = rate_plain(puzzle)
+        if grade_of(rating) == grade:
+            return puzzle, rating
+
+# 随机生成 Killer 布局，直到得到一个唯一解的布局
+def unique_layout(rnd, max_size=5):
+    while True:
+        layout = killer_layout(random_grid(rnd), rnd, max_size)
+        k = Killer()
+        k.read_cages(layout)
+        if k.count_solutions() == 1:
+            return layout
+
+# 生成一个唯一解的 Killer 布局，等级同样按照 classic 求值方法评定
+def generate_layout(grade, rnd, max_size=5):
+    while True:
+        layout = unique_layout(rnd, max_size)
+        rating = rate_layout(layout)
+        if grade_of(rating) == grade:
+            return layout, rating
+
+def generate_job(job):
+    grade, killer, seed = job
+    rnd = random.Random(seed)
+    return generate_layout(grade, rnd) if killer else generate_plain(grade, rnd)
+
+# 依次返回 count 个 (盘面, 评级)；jobs 大于 1 时用进程池并行生成，per_minute 为每分钟最多输出的盘面数
+def generate(count, grade='medium', killer=False, jobs=1, seed=0, per_minute=None):
+    tasks = [(grade, killer, '{0}-{1}'.format(seed, i)) for i in range(count)]
+    begin_time = time.time()
+    with contextlib.ExitStack() as stack:
+        if jobs <= 1:
+            results = map(generate_job, tasks)
+        else:
+            results = stack.enter_context(multiprocessing.Pool(jobs)).imap_unordered(generate_job, tasks)
+        for done, result in enumerate(results, 1):
+            if per_minute:
+                ahead = begin_time + done * 60.0 / per_minute - time.time()
+                if ahead > 0:
+                    time.sleep(ahead)
+            yield result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--grade', choices=list(GRADES), default='medium')
+    parser.add_argument('--killer', action='store_true', help='generate Killer cage layouts')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate', type=float, help='target puzzles per minute')
+    parser.add_argument('--output', default='-', help='where to write puzzles')
+    args = parser.parse_args()
+
+    ratings = {}
+    def puzzles():
+        for puzzle, rating in generate(args.count, args.grade, args.killer, args.jobs, args.seed, args.rate):
+            ratings[rating] = ratings.get(rating, 0) + 1
+            yield puzzle
+    begin_time = time.time()
+    write_puzzles(args.output, puzzles())
+    end_time = time.time()
+    per_minute = args.count * 60.0 / max(end_time - begin_time, 1e-9)
+    print('{0} puzzles, {1} puzzles/min, ratings: {2}'.format(args.count, round(per_minute, 1), ratings), file=sys.stderr)
+    if args.rate and per_minute < args.rate * 0.95:
+        print('Target rate of {0} puzzles/min not reached, try more --jobs.'.format(args.rate), file=sys.stderr)
@@ -1,73 +1,233 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
-import copy
+import argparse
+import collections
+import contextlib
+import dbm
+import gzip
+import io
 import itertools
+import json
+import mmap
+import multiprocessing
+import os
 import sys
 import time
+from array import array
 from colorama import *
 from functools import reduce
 from pprint import pprint
 
 SHOW_STEP_SOLVED = False
 
+# 候选数以 9 位整数表示：第 n-1 位为 1 即表示 n 是候选数
+ALL_NOMINEES = 0x1ff
+MASK_NOMINEES = [[n for n in range(1, 10) if mask & (1 << (n - 1))] for mask in range(ALL_NOMINEES + 1)]
+MASK_COUNT = [len(nominees) for nominees in MASK_NOMINEES]
+
+# 27 个 unit 的 cell 下标，依次为 9 个 row、9 个 column、9 个 block，cell 下标为 row * 9 + column
+UNITS = tuple(tuple(row * 9 + column for column in range(9)) for row in range(9)) + \
+    tuple(tuple(row * 9 + column for row in range(9)) for column in range(9)) + \
+    tuple(tuple((block // 3 * 3 + i // 3) * 9 + block % 3 * 3 + i % 3 for i in range(9)) for block in range(9))
+UNIT_OFFSET = {'row': 0, 'column': 9, 'block': 18, 'cage': 27}
+# 每个 cell 所在的 unit ，以及与它同一 row/column/block 的其它 20 个 cell
+CELL_UNITS = tuple(tuple(u for u in range(len(UNITS)) if index in UNITS[u]) for index in range(81))
+PEERS = tuple(tuple(sorted(set(x for u in CELL_UNITS[index] for x in UNITS[u]) - {index})) for index in range(81))
+
+# 盘面状态保存在一个 array 中：[VALUE, VALUE + 81) 为各 cell 的值，[MASK, MASK + 81) 为各 cell 的候选数掩码，
+# DIGIT_ROW + (n - 1) * 9 + row 为数字 n 在该 row 中可填的 column 掩码，DIGIT_COLUMN + (n - 1) * 9 + column 为数字 n 在该 column 中可填的 row 掩码，
+# PLACED 之后为各 unit 已填入数字的掩码
+VALUE = 0
+MASK = 81
+DIGIT_ROW = 162
+DIGIT_COLUMN = 243
+PLACED = 324
+
+def bit(value):
+    return 1 << (value - 1)
+
+# 掩码中各数字在 DIGIT_ROW/DIGIT_COLUMN 中的偏移
+MASK_OFFSETS = [[(n - 1) * 9 for n in nominees] for nominees in MASK_NOMINEES]
+
+# 写入某个 cell 的候选数掩码，同时更新变化的数字在所在 row/column 中的位置掩码
+def write_mask(state, index, mask):
+    changed = state[MASK + index] ^ mask
+    state[MASK + index] = mask
+    row, column = divmod(index, 9)
+    row_slot, column_slot = DIGIT_ROW + row, DIGIT_COLUMN + column
+    column_bit, row_bit = 1 << column, 1 << row
+    for offset in MASK_OFFSETS[changed]:
+        state[row_slot + offset] ^= column_bit
+        state[column_slot + offset] ^= row_bit
+
 class Cell(object):
+    # cell 只是盘面状态中某个下标的视图，本身不保存值和候选数
+    __slots__ = ('state', 'row', 'column', 'index', 'block', 'cage', 'is_given', 'attempted')
     
-    def __init__(self, row, column, value=0):
+    def __init__(self, state, row, column):
+        self.state = state
         self.row = row
         self.column = column
+        self.index = row * 9 + column
         self.block = ((row // 3) * 3) + (column // 3)
         self.cage = -1
-        self.value = value
-        self.nominees = [n for n in range(1, 10)] if value == 0 else []
         self.is_given = False
         self.attempted = False
 
+    @property
+    def value(self):
+        return self.state[VALUE + self.index]
+
+    @value.setter
+    def value(self, value):
+        self.state[VALUE + self.index] = value
+
+    @property
+    def mask(self):
+        return self.state[MASK + self.index]
+
+    @mask.setter
+    def mask(self, mask):
+        write_mask(self.state, self.index, mask)
+
+    @property
+    def nominees(self):
+        return list(MASK_NOMINEES[self.mask])
+
     def give(self, value):
         self.value = value
-        self.nominees = []
+        self.mask = 0
         self.is_given = True
 
     def confirm(self, value):
         self.value = value
-        self.nominees = []
+        self.mask = 0
 
     def clear(self):
-        if len(self.nominees) == 1 and self.value == 0:
-            self.value = self.nominees[0]
-            self.nominees = []
+        if MASK_COUNT[self.mask] == 1 and self.value == 0:
+            self.value = MASK_NOMINEES[self.mask][0]
+            self.mask = 0
         return self.value
 
 
 class Sudoku(object):
+    # whole_solve() 调度的求值方法，按优先级排列
+    STRATEGIES = ['kill_nominees', 'unique_nominee', 'pointing_pair', 'box_line_reduction', 'number_chain', 'x_wing', 'y_wing', 'xyz_wing', 'swordfish']
 
     def __init__(self):
-        self.cells = {}
-        for row in range(9):
-            for column in range(9):
-                cell = Cell(row, column)
-                self.cells[(row, column)] = cell
+        self.units = UNITS
+        self.cell_units = CELL_UNITS
+        self.peers = PEERS
+        self.state = array('H', [0] * 81 + [ALL_NOMINEES] * 81 + [ALL_NOMINEES] * 162 + [0] * len(self.units))
+        self.grid = [Cell(self.state, index // 9, index % 9) for index in range(81)]
+        self.cells = {(cell.row, cell.column): cell for cell in self.grid}
         self.initiative_unsolved = 81
+        self.search_stats = {'nodes': 0, 'max_depth': 0, 'timeout': False}
+        # 各求值方法的调用次数、耗时、去除的候选数和填入的 cell 数
+        self.profile = {}
+        self.eliminated_count = 0
+        self.placed_count = 0
+        # 正在 measure() 中的外层方法累计的内层调用的耗时、去除的候选数和填入的 cell 数
+        self.nested = None
+        self.reset_pending()
 
+    # 有变化的 unit 依次记入 self.changes ，每个求值方法记录自己已经处理到 self.changes 的哪个位置，初始时所有 unit 都需要处理
+    def reset_pending(self):
+        self.changes = [tuple(range(len(self.units)))]
+        self.handled = {name: 0 for name in self.STRATEGIES}
+
+    # 某个 cell 有变化，它所在的 unit 需要被所有求值方法重新处理
+    def touch(self, index):
+        self.changes.append(self.cell_units[index])
+
+    # 某个求值方法上次运行以来有变化的 unit ，并标记为已处理
+    def take_pending(self, name):
+        units = set().union(*self.changes[self.handled[name]:])
+        self.handled[name] = len(self.changes)
+        # 所有求值方法都处理过的记录可以丢弃
+        done = min(self.handled.values())
+        if done > 1024:
+            del self.changes[:done]
+            for key in self.handled:
+                self.handled[key] -= done
+        return sorted(units)
+
+    # 去除某个 cell 的候选数，只有候选数确实减少时才标记变化
+    def eliminate(self, index, mask):
+        if self.state[MASK + index] & mask:
+            self.eliminated_count += MASK_COUNT[self.state[MASK + index] & mask]
+            write_mask(self.state, index, self.state[MASK + index] & ~mask)
+            self.touch(index)
+
+    # 调用某个求值方法并把这次调用记入 self.profile ；只记本身的部分，期间经 measure() 调用的其它方法（如 search 每个节点中的推理）记在它们自己名下，
+    # 因此 search/attempt 的耗时和去除的候选数只包括分支本身，各方法的记录相加即为总数
+    def measure(self, name, method, *args):
+        eliminated_count, placed_count = self.eliminated_count, self.placed_count
+        outer, self.nested = self.nested, {'time': 0.0, 'eliminated': 0, 'placed': 0}
+        begin_time = time.perf_counter()
+        try:
+            result = method(*args)
+        finally:
+            inner, self.nested = self.nested, outer
+        total = {'time': time.perf_counter() - begin_time, 'eliminated': self.eliminated_count - eliminated_count, 'placed': self.placed_count - placed_count}
+        record = self.profile.setdefault(name, {'calls': 0, 'time': 0.0, 'eliminated': 0, 'placed': 0})
+        record['calls'] += 1
+        for key in total:
+            record[key] += total[key] - inner[key]
+            if outer is not None:
+                outer[key] += total[key]
+        return result
+
+    # 本盘面的求解报告，可以直接 json.dumps()；cached 表示解是从缓存中得到的
+    def report(self):
+        return {
+            'unsolved': self.get_unsolved_count(),
+            'cached': False,
+            'strategies': {name: dict(record) for name, record in self.profile.items()},
+            'search': dict(self.search_stats),
+        }
+
+    # 保存盘面状态，只复制一个 array
+    def snapshot(self):
+        return self.state[:]
+
+    def restore(self, snapshot):
+        self.state[:] = snapshot
+
+    # 文件中不是恰好 81 个数字时抛出 ValueError
     def read_sudoku(self, filename):
         with open(filename) as f:
             numbers = list(map(lambda y: int(y), list(filter(lambda x: x in [str(n) for n in range(0, 10)], list(f.read())))))
         if len(numbers) != 81:
-            print('Invalid sudoku')
-            exit()
+            raise ValueError('Invalid sudoku: {0} digits'.format(len(numbers)))
+        self.fill_numbers(numbers)
+
+    # 读入一行 81 个字符的盘面，'0' 或 '.' 表示空格
+    def read_plain(self, plain):
+        self.fill_numbers([0 if x == '.' else int(x) for x in plain])
+
+    def fill_numbers(self, numbers):
         for index, num in enumerate(numbers):
             if num > 0:
-                column = index % 9
-                row = (index - column) / 9
+                row, column = divmod(index, 9)
                 self.cells[(row, column)].give(num)
+                self.suppress(self.cells[(row, column)], num)
         self.initiative_unsolved = self.get_unsolved_count()
 
+    # 把一个完整的解填入所有空 cell
+    def fill_solution(self, plain):
+        for cell, x in zip(self.grid, plain):
+            if cell.value == 0:
+                cell.confirm(int(x))
+                self.suppress(cell, int(x))
+
+    # 当前盘面在等价变换下的规范形式，见 canonical_form()
+    def canonical(self):
+        return canonical_form(self.plain_sudoku())
+
     def plain_sudoku(self):
-        plain = ''
-        for row in range(9):
-            for column in range(9):
-                plain += str(self.cells[(row, column)].value)
-        return plain
+        return ''.join(str(cell.value) for cell in self.grid)
 
     def display_sudoku(self):
         for i in range(9):
@@ -82,87 +242,68 @@ class Sudoku(object):
         print('{solved}/{initiative} blanks filled.'.format(solved=(self.initiative_unsolved - self.get_unsolved_count()), initiative=self.initiative_unsolved))
 
     def check_sudoku(self):
-        finish_flag = True
-        for row in range(9):
-            for column in range(9):
-                if self.cells[(row, column)].value == 0:
-                    finish_flag = False
+        finish_flag = self.get_unsolved_count() == 0
+        clear_flag = True
+        for unit in UNITS:
+            seen = 0
+            for index in unit:
+                value = self.grid[index].value
+                if value != 0:
+                    if seen & bit(value):
+                        clear_flag = False
+                    seen |= bit(value)
+            # 如果已完成，检查是否每个 row/column/block 都恰好包含 1-9
+            if finish_flag and seen != ALL_NOMINEES:
+                clear_flag = False
         if not finish_flag:
             # 如果未完成，只检查在同一 row/column/block 内是否有重复数，以及是否存在没有候选数的空 cell
-            clear_flag = True
-            unit = ['row', 'column', 'block']
-            for i in range(9):
-                for u in unit:
-                    if list(map(lambda y: y.value, list(filter(lambda x: x.value != 0, self.get_cells_by(u, i))))) != list(set(list(map(lambda y: y.value, list(filter(lambda x: x.value != 0, self.get_cells_by(u, i))))))):
-                        clear_flag = False
-            for row in range(9):
-                for column in range(9):
-                    if self.cells[(row, column)].value == 0 and len(self.cells[(row, column)].nominees) == 0:
-                        clear_flag = False
-            return clear_flag
-        else:
-            # 如果已完成，检查是否每个 row/column/block 都是正确的
-            clear_flag = True
-            unit = ['row', 'column', 'block']
-            for i in range(9):
-                for u in unit:
-                    if set(list(map(lambda x: x.value, self.get_cells_by(u, i)))) != set([x for x in range(1, 10)]):
-                        clear_flag = False
-            return clear_flag
+            for cell in self.grid:
+                if cell.value == 0 and cell.mask == 0:
+                    clear_flag = False
+        return clear_flag
 
     def get_cells_by(self, unit, num):
-        cells = []
-        if unit == 'row':
-            for i in range(9):
-                cells.append(self.cells[(num, i)])
-        elif unit == 'column':
-            for i in range(9):
-                cells.append(self.cells[(i, num)])
-        elif unit == 'block':
-            for i in range(9):
-                for j in range(9):
-                    if self.cells[(i, j)].block == num:
-                        cells.append(self.cells[(i, j)])
-        else:
+        if unit not in UNIT_OFFSET:
             return None
-        return cells
+        return [self.grid[index] for index in self.units[UNIT_OFFSET[unit] + num]]
 
     def get_unsolved_count(self):
-        count = 0
-        for row in range(9):
-            for column in range(9):
-                if self.cells[(row, column)].value == 0:
-                    count += 1
-        return count
+        return self.state[VALUE:VALUE + 81].count(0)
 
-    # 当一个 cell 确定后，必须调用此方法，去除与该 cell 同一 row/column/block 的其它 cell 的候选数
+    # 当一个 cell 确定后，必须调用此方法，记录该 cell 所在各个 unit 已填入的数，并去除其它 peer cell 的候选数
     def suppress(self, cell, value):
-        for row in range(9):
-            for column in range(9):
-                if row == cell.row or column == cell.column or self.cells[(row, column)].block == cell.block:
-                    if value in self.cells[(row, column)].nominees:
-                        self.cells[(row, column)].nominees.remove(value)
-
-    # 遍历每一个 cell 并去除候选数，然后遍历 cell.clear() 一次
-    def kill_nominees(self):
-        previous_unsolved = None
-        preview = unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for row in range(9):
-                for column in range(9):
-                    # 当某个 cell 为空时
-                    if self.cells[(row, column)].value == 0:
-                        nominee_set = set(self.cells[(row, column)].nominees)
-                        others_in_row = set(list(map(lambda x: x.value, self.get_cells_by('row', row))))
-                        others_in_column = set(list(map(lambda x: x.value, self.get_cells_by('column', column))))
-                        others_in_block = set(list(map(lambda x: x.value, self.get_cells_by('block', self.cells[(row, column)].block))))
-                        self.cells[(row, column)].nominees = list(nominee_set - others_in_row - others_in_column - others_in_block)
-            for row in range(9):
-                for column in range(9):
-                    newly_fill = self.cells[(row, column)].clear()
-                    self.suppress(self.cells[(row, column)], newly_fill)
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
+        if value == 0:
+            return
+        state = self.state
+        b = bit(value)
+        for unit in self.cell_units[cell.index]:
+            state[PLACED + unit] |= b
+        write_mask(state, cell.index, state[MASK + cell.index] & ~b)
+        self.placed_count += 1
+        self.touch(cell.index)
+        for index in self.peers[cell.index]:
+            if state[MASK + index] & b:
+                write_mask(state, index, state[MASK + index] & ~b)
+                self.eliminated_count += 1
+                self.touch(index)
+
+    # 某个 cell 所在的各个 unit 中已填入数字的掩码
+    def placed_mask(self, cell):
+        mask = 0
+        for unit in self.cell_units[cell.index]:
+            mask |= self.state[PLACED + unit]
+        return mask
+
+    # 遍历 units 中的每一个空 cell 并去除候选数，然后 cell.clear() 一次；units 为 None 时处理所有 row/column/block
+    def kill_nominees(self, units=None):
+        for unit in range(len(UNITS)) if units is None else units:
+            for index in self.units[unit]:
+                cell = self.grid[index]
+                # 当某个 cell 为空时
+                if cell.value == 0:
+                    self.eliminate(index, self.placed_mask(cell))
+                    newly_fill = cell.clear()
+                    self.suppress(cell, newly_fill)
         if SHOW_STEP_SOLVED:
             print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.kill_nominees.__name__))
         if self.get_unsolved_count() == 0:
@@ -170,23 +311,23 @@ class Sudoku(object):
         return False
 
     # 遍历每一个 row/column/block ，如果 row/column/block 内唯一有一个空 cell 拥有某个候选数，这个空 cell 就可以 confirm 这个候选数
-    def unique_nominee(self):
-        previous_unsolved = None
-        preview = unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for unit in ['row', 'column', 'block']:
-                for num in range(9):
-                    empty_cells = list(filter(lambda x: x.value == 0, self.get_cells_by(unit, num)))
-                    if len(empty_cells) > 1:
-                        for index, value in enumerate(empty_cells):
-                            others_nominees = set(reduce(lambda x, y: x + y, list(map(lambda w: w.nominees, list(filter(lambda z: empty_cells.index(z) != index, empty_cells))))))
-                            this_nominees = list(set(value.nominees) - others_nominees)
-                            if len(this_nominees) == 1:
-                                unique_cell = empty_cells[index]
-                                self.cells[(unique_cell.row, unique_cell.column)].confirm(this_nominees[0])
-                                self.suppress(self.cells[(unique_cell.row, unique_cell.column)], this_nominees[0])
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
+    def unique_nominee(self, units=None):
+        for unit in range(len(UNITS)) if units is None else units:
+            if unit >= len(UNITS):
+                continue
+            empty_cells = [self.grid[index] for index in UNITS[unit] if self.grid[index].value == 0]
+            if len(empty_cells) > 1:
+                # once 为至少出现一次的候选数，twice 为至少出现两次的候选数
+                once = twice = 0
+                for cell in empty_cells:
+                    twice |= once & cell.mask
+                    once |= cell.mask
+                for cell in empty_cells:
+                    this_nominees = cell.mask & once & ~twice
+                    if MASK_COUNT[this_nominees] == 1:
+                        value = MASK_NOMINEES[this_nominees][0]
+                        cell.confirm(value)
+                        self.suppress(cell, value)
         if SHOW_STEP_SOLVED:
             print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.unique_nominee.__name__))
         if self.get_unsolved_count() == 0:
@@ -194,146 +335,317 @@ class Sudoku(object):
         return False
 
     # 显/隐性数组：如果某个 row/column/block 中，有 m 个空 cell ，由其中 n(m>n) 个空 cell 的候选数组成的集合元素个数恰好为 n ，那么可以在另外的那 m-n 个空 cell 中去除这些候选数
-    def number_chain(self):
-        previous_unsolved = None
-        preview = unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for rank in [2, 3]:
-                for unit in ['row', 'column', 'block']:
-                    for num in range(9):
-                        empty_cells = list(filter(lambda x: x.value == 0, self.get_cells_by(unit, num)))
-                        # 有效的 n 链数只会出现在至少 n+1 个空 cell 的情况中
-                        if len(empty_cells) > rank:
-                            combinations = itertools.combinations(empty_cells, rank)
-                            for c in combinations:
-                                combination_nominees = list(map(lambda x: x.nominees, c))
-                                combination_nominees_set = set([x for y in combination_nominees for x in y])
-                                if len(combination_nominees_set) == rank:
-                                    for other_empty in list(filter(lambda x: x not in c, empty_cells)):
-                                        for n in combination_nominees_set:
-                                            if n in other_empty.nominees:
-                                                self.cells[(other_empty.row, other_empty.column)].nominees.remove(n)
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
+    def number_chain(self, units=None):
+        for rank in [2, 3]:
+            for unit in range(len(UNITS)) if units is None else units:
+                if unit >= len(UNITS):
+                    continue
+                empty_cells = [self.grid[index] for index in UNITS[unit] if self.grid[index].value == 0]
+                # 有效的 n 链数只会出现在至少 n+1 个空 cell 的情况中
+                if len(empty_cells) > rank:
+                    combinations = itertools.combinations(empty_cells, rank)
+                    for c in combinations:
+                        combination_mask = 0
+                        for cell in c:
+                            combination_mask |= cell.mask
+                        if MASK_COUNT[combination_mask] == rank:
+                            for other_empty in empty_cells:
+                                if other_empty not in c:
+                                    self.eliminate(other_empty.index, combination_mask)
         if SHOW_STEP_SOLVED:
             print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.number_chain.__name__))
         if self.get_unsolved_count() == 0:
             return True
         return False
 
-    # Y-wing
-    def y_wing(self):
-        previous_unsolved = None
-        preview = unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for num in range(9):
-                block = self.get_cells_by('block', num)
-                doubles = list(filter(lambda x: len(x.nominees) == 2, block))
-                double_group = list(itertools.combinations(doubles, 2))
-                available_group = list(filter(lambda x: len(set(x[0].nominees) & set(x[1].nominees)) == 3 and x[0].row != x[1].row and x[0].column != x[1].column, double_group))
-                if len(available_group) == 0:
-                    continue
-                for ag in available_group:
-                    third_area = []
-                    third_area.append(self.get_cells_by('row', ag[0].row))
-                    third_area.append(self.get_cells_by('row', ag[1].row))
-                    third_area.append(self.get_cells_by('column', ag[0].column))
-                    third_area.append(self.get_cells_by('column', ag[1].column))
-                    third_area = list(filter(lambda x: x.block != num, third_area))
-                    for cell in third_area:
-                        if set(cell.nominees) == set(ag[0].nominees) ^ set(ag[1].nominees):
-                            if cell.row == ag[0].row or cell.column == ag[0].column:
-                                nominee_to_delete = (set(cell.nominees) & set(ag[1].nominees)).pop()
-                                inner_influence = [x for y in [self.get_cells_by('row', ag[1].row), self.get_cells_by('column', ag[1].column), self.get_cells_by('block', ag[1].block)] for x in y]
-                                outer_influence = [x for y in [self.get_cells_by('row', cell.row), self.get_cells_by('column', cell.column), self.get_cells_by('block', cell.block)] for x in y]
-                                common_influence = list(set(inner_influence) & set(outer_influence))
-                                for ci in common_influence:
-                                    if nominee_to_delete in ci.nominees:
-                                        self.cells[(ci.row, ci.column)].nominees.remove(nominee_set)
-                            if cell.row == ag[1].row or cell.column == ag[1].column:
-                                nominee_to_delete = (set(cell.nominees) & set(ag[0].nominees)).pop()
-                                inner_influence = [x for y in [self.get_cells_by('row', ag[0].row), self.get_cells_by('column', ag[0].column), self.get_cells_by('block', ag[0].block)] for x in y]
-                                outer_influence = [x for y in [self.get_cells_by('row', cell.row), self.get_cells_by('column', cell.column), self.get_cells_by('block', cell.block)] for x in y]
-                                common_influence = list(set(inner_influence) & set(outer_influence))
-                                for ci in common_influence:
-                                    if nominee_to_delete in ci.nominees:
-                                        self.cells[(ci.row, ci.column)].nominees.remove(nominee_set)
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
+    # 宫内某个数的候选位置都在同一 row/column 上时，这个 row/column 在宫外的 cell 不能填这个数
+    def pointing_pair(self, units=None):
+        state = self.state
+        for unit in range(UNIT_OFFSET['block'], len(UNITS)) if units is None else units:
+            if not UNIT_OFFSET['block'] <= unit < len(UNITS):
+                continue
+            band, stack = divmod(unit - UNIT_OFFSET['block'], 3)
+            for n in range(9):
+                rows = [r for r in range(band * 3, band * 3 + 3) if state[DIGIT_ROW + n * 9 + r] >> (stack * 3) & 7]
+                if len(rows) == 1:
+                    for c in MASK_NOMINEES[state[DIGIT_ROW + n * 9 + rows[0]] & ~(7 << (stack * 3))]:
+                        self.eliminate(rows[0] * 9 + c - 1, 1 << n)
+                columns = [c for c in range(stack * 3, stack * 3 + 3) if state[DIGIT_COLUMN + n * 9 + c] >> (band * 3) & 7]
+                if len(columns) == 1:
+                    for r in MASK_NOMINEES[state[DIGIT_COLUMN + n * 9 + columns[0]] & ~(7 << (band * 3))]:
+                        self.eliminate((r - 1) * 9 + columns[0], 1 << n)
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.pointing_pair.__name__))
+        if self.get_unsolved_count() == 0:
+            return True
+        return False
+
+    # row/column 内某个数的候选位置都在同一个宫内时，这个宫在该 row/column 之外的 cell 不能填这个数
+    def box_line_reduction(self, units=None):
+        state = self.state
+        for unit in range(UNIT_OFFSET['block']) if units is None else units:
+            if unit >= UNIT_OFFSET['block']:
+                continue
+            line, offset = (unit, DIGIT_ROW) if unit < UNIT_OFFSET['column'] else (unit - UNIT_OFFSET['column'], DIGIT_COLUMN)
+            for n in range(9):
+                positions = state[offset + n * 9 + line]
+                parts = [k for k in range(3) if positions >> (k * 3) & 7]
+                if len(parts) == 1:
+                    block = line // 3 * 3 + parts[0] if offset == DIGIT_ROW else parts[0] * 3 + line // 3
+                    for index in UNITS[UNIT_OFFSET['block'] + block]:
+                        if (index // 9 if offset == DIGIT_ROW else index % 9) != line:
+                            self.eliminate(index, 1 << n)
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.box_line_reduction.__name__))
+        if self.get_unsolved_count() == 0:
+            return True
+        return False
+
+    # size 条 row（column）中某个数的候选位置合起来恰好落在 size 条 column（row）上时，这些 column（row）的其它 cell 不能填这个数
+    def fish(self, size):
+        state = self.state
+        for base, cover in [(DIGIT_ROW, DIGIT_COLUMN), (DIGIT_COLUMN, DIGIT_ROW)]:
+            for n in range(9):
+                lines = [(line, state[base + n * 9 + line]) for line in range(9) if 2 <= MASK_COUNT[state[base + n * 9 + line]] <= size]
+                for group in itertools.combinations(lines, size):
+                    union = 0
+                    chosen = 0
+                    for line, positions in group:
+                        union |= positions
+                        chosen |= 1 << line
+                    if MASK_COUNT[union] != size:
+                        continue
+                    for m in MASK_NOMINEES[union]:
+                        for other in MASK_NOMINEES[state[cover + n * 9 + m - 1] & ~chosen]:
+                            self.eliminate((other - 1) * 9 + m - 1 if base == DIGIT_ROW else (m - 1) * 9 + other - 1, 1 << n)
+        if self.get_unsolved_count() == 0:
+            return True
+        return False
+
+    # X-Wing ：位置掩码只与数字有关，每次都检查所有 row/column ，units 只用于调度
+    def x_wing(self, units=None):
+        solved = self.fish(2)
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.x_wing.__name__))
+        return solved
+
+    def swordfish(self, units=None):
+        solved = self.fish(3)
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.swordfish.__name__))
+        return solved
+
+    # 候选数恰好为两个的空 cell ，按候选数掩码分组，wing 的 pincer 直接按掩码查找
+    def bivalue_cells(self):
+        bivalues = {}
+        for index in range(81):
+            mask = self.state[MASK + index]
+            if self.state[VALUE + index] == 0 and MASK_COUNT[mask] == 2:
+                bivalues.setdefault(mask, []).append(index)
+        return bivalues
+
+    # units 中的空 cell ，units 为 None 时为所有 cell
+    def unit_cells(self, units=None):
+        if units is None:
+            return range(81)
+        return sorted(set(index for unit in units for index in self.units[unit]))
+
+    # Y-wing（XY-wing）：pivot 的候选数为 {a, b} ，与它互为 peer 的两个 pincer 的候选数分别为 {a, c} 和 {b, c} ，则同时能看到两个 pincer 的 cell 不能填 c
+    def y_wing(self, units=None):
+        bivalues = self.bivalue_cells()
+        for pivot in self.unit_cells(units):
+            mask = self.state[MASK + pivot]
+            if self.state[VALUE + pivot] != 0 or MASK_COUNT[mask] != 2:
+                continue
+            a, b = MASK_NOMINEES[mask]
+            peers = set(self.peers[pivot])
+            for c in MASK_NOMINEES[ALL_NOMINEES & ~mask]:
+                xs = [x for x in bivalues.get(bit(a) | bit(c), ()) if x in peers]
+                ys = [y for y in bivalues.get(bit(b) | bit(c), ()) if y in peers]
+                for x in xs:
+                    for y in ys:
+                        for index in set(self.peers[x]) & set(self.peers[y]):
+                            self.eliminate(index, bit(c))
         if SHOW_STEP_SOLVED:
             print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.y_wing.__name__))
         if self.get_unsolved_count() == 0:
             return True
         return False
 
-    # 暴力尝试
-    def attempt(self):
+    # XYZ-wing：pivot 的候选数为 {a, b, c} ，与它互为 peer 的两个 pincer 的候选数分别为 {a, c} 和 {b, c} ，则同时能看到 pivot 和两个 pincer 的 cell 不能填 c
+    def xyz_wing(self, units=None):
+        bivalues = self.bivalue_cells()
+        for pivot in self.unit_cells(units):
+            mask = self.state[MASK + pivot]
+            if self.state[VALUE + pivot] != 0 or MASK_COUNT[mask] != 3:
+                continue
+            peers = set(self.peers[pivot])
+            for c in MASK_NOMINEES[mask]:
+                a, b = MASK_NOMINEES[mask & ~bit(c)]
+                xs = [x for x in bivalues.get(bit(a) | bit(c), ()) if x in peers]
+                ys = [y for y in bivalues.get(bit(b) | bit(c), ()) if y in peers]
+                for x in xs:
+                    for y in ys:
+                        for index in peers & set(self.peers[x]) & set(self.peers[y]):
+                            self.eliminate(index, bit(c))
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.xyz_wing.__name__))
+        if self.get_unsolved_count() == 0:
+            return True
+        return False
+
+    # 判断盘面是有错误、无错误且未完成、无错误且已完成三种情况中的哪一种，分别以-1、0、1表示
+    def situation(self):
+        empty_flag = False
+        for index in range(81):
+            if self.state[VALUE + index] == 0:
+                empty_flag = True
+                if self.state[MASK + index] == 0:
+                    return -1
+        return 0 if empty_flag else 1
+
+    # 暴力尝试，每个分支从同一个 snapshot 出发，不再复制整个 Sudoku 对象；search 为 True 时改为完整的深度优先搜索
+    def attempt(self, search=False, time_limit=None):
+        if search:
+            return self.search(time_limit)
         while(True):
-            empty_cells = []
-            for row in range(9):
-                for column in range(9):
-                    if self.cells[(row, column)].value == 0 and not self.cells[(row, column)].attempted:
-                        empty_cells.append(copy.copy(self.cells[(row, column)]))
+            empty_cells = [cell for cell in self.grid if cell.value == 0 and not cell.attempted]
             if len(empty_cells) == 0:
                 break
-            empty_cells = sorted(empty_cells, key=lambda x: len(x.nominees))
-            target = empty_cells[0]
+            target = min(empty_cells, key=lambda x: MASK_COUNT[x.mask])
             print('Attempting ({r}, {c})...'.format(r=target.row, c=target.column))
-            copies = []
-            for i in range(len(target.nominees)):
-                c = copy.deepcopy(self)
-                copies.append(c)
-            for index in range(len(copies)):
-                copies[index].cells[(target.row, target.column)].confirm(target.nominees[index])
-                copies[index].suppress(copies[index].cells[(target.row, target.column)], target.nominees[index])
-                copies[index].whole_solve()
+            origin = self.snapshot()
+            nominees = target.nominees
             situations = []
-            for c in copies:
-                # 判断 whole_solve() 后的盘面是有错误、无错误且未完成、无错误且已完成三种情况中的哪一种，并在 situations 列表中分别以-1、0、1表示
-                wrong_flag = False
-                empty_flag = False
-                for row in range(9):
-                    for column in range(9):
-                        if c.cells[(row, column)].value == 0:
-                            empty_flag = True
-                            if len(c.cells[(row, column)].nominees) == 0:
-                                wrong_flag = True
-                if wrong_flag:
-                    situations.append(-1)
-                elif empty_flag:
-                    situations.append(0)
-                else:
-                    situations.append(1)
-            # 先判断是否有1，如果有1，直接返回已完成的盘面
-            if 1 in situations:
-                for row in range(9):
-                    for column in range(9):
-                        self.cells[(row, column)] = copies[situations.index(1)].cells[(row, column)]
-                return
+            for nominee in nominees:
+                self.restore(origin)
+                self.search_stats['nodes'] += 1
+                self.search_stats['max_depth'] = 1
+                target.confirm(nominee)
+                self.suppress(target, nominee)
+                self.whole_solve()
+                situations.append(self.situation())
+                # 如果有1，直接保留已完成的盘面
+                if situations[-1] == 1:
+                    return
+            self.restore(origin)
             # 如果没有1，判断是否只有一个0，如果只有一个0，可以 confirm()
-            elif situations.count(0) == 1:
-                pass
+            if situations.count(0) == 1:
+                nominee = nominees[situations.index(0)]
+                target.confirm(nominee)
+                self.suppress(target, nominee)
             # 如果0的个数大于一，只能去掉造成-1的那些候选数
+            elif -1 in situations:
+                for nominee, situation in zip(nominees, situations):
+                    if situation == -1:
+                        self.eliminate(target.index, bit(nominee))
             else:
-                pass
-            self.cells[(target.row, target.column)].attempted = True # 如果 cell 在尝试过所有候选数都没有确定，改变这个标志位，在其它 cell 有候选数的变动之前不再尝试这个 cell
+                target.attempted = True # 如果 cell 在尝试过所有候选数都没有确定，改变这个标志位，在其它 cell 有候选数的变动之前不再尝试这个 cell
+                continue
+            # 盘面有了变化，之前尝试过的 cell 可以重新尝试
+            for cell in self.grid:
+                cell.attempted = False
+            self.whole_solve()
         if SHOW_STEP_SOLVED:
             print('{funcname}(): {0}/{1} solved.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.attempt.__name__))
+
+    # 完整的深度优先搜索：每个节点先用 whole_solve() 推理，再选候选数最少的 cell 分支，出现矛盾时回溯
+    def search(self, time_limit=None):
+        self.search_stats = {'nodes': 0, 'max_depth': 0, 'timeout': False}
+        deadline = None if time_limit is None else time.time() + time_limit
+        solved = self.descend(0, deadline)
+        if SHOW_STEP_SOLVED:
+            print('{funcname}(): {0}/{1} solved, {nodes} nodes, max depth {max_depth}.'.format(self.initiative_unsolved - self.get_unsolved_count(), self.initiative_unsolved, funcname=self.search.__name__, **self.search_stats))
+        return solved
+
+    def descend(self, depth, deadline):
+        self.search_stats['nodes'] += 1
+        self.search_stats['max_depth'] = max(self.search_stats['max_depth'], depth)
+        self.whole_solve()
+        situation = self.situation()
+        if situation == -1 or not self.check_sudoku():
+            return False
+        if situation == 1:
+            return True
+        if deadline is not None and time.time() > deadline:
+            self.search_stats['timeout'] = True
+            return False
+        target = min((cell for cell in self.grid if cell.value == 0), key=lambda x: MASK_COUNT[x.mask])
+        origin = self.snapshot()
+        for nominee in target.nominees:
+            target.confirm(nominee)
+            self.suppress(target, nominee)
+            if self.descend(depth + 1, deadline):
+                return True
+            self.restore(origin)
+            if self.search_stats['timeout']:
+                break
+        return False
     
-    # 按照优先级，往复遍历一次所有求值方法
+    # 用 Dancing Links 求解当前盘面，返回解的个数（最多 limit 个），有解时把第一个解填入盘面；超过 time_limit 秒时停止并在 search_stats 中记为超时
+    def dlx_solve(self, limit=1, time_limit=None):
+        givens = [(cell.index, cell.value) for cell in self.grid if cell.value != 0]
+        links = DancingLinks()
+        count, solution = links.solve(givens, limit, None if time_limit is None else time.time() + time_limit)
+        self.search_stats['timeout'] = links.timeout
+        if solution is not None:
+            for r in solution:
+                index, digit = divmod(r, 9)
+                cell = self.grid[index]
+                if cell.value == 0:
+                    cell.confirm(digit + 1)
+                    self.suppress(cell, digit + 1)
+        return count
+
+    # 数出当前盘面的解的个数，数到 limit 个就停止，盘面保持不变；strategy 在每个节点先用 whole_solve() 推理再分支，dlx 用 Dancing Links 计数
+    def count_solutions(self, limit=2, engine='strategy'):
+        if engine == 'dlx':
+            return DancingLinks().solve([(cell.index, cell.value) for cell in self.grid if cell.value != 0], limit)[0]
+        origin = self.snapshot()
+        count = self.count_from(limit)
+        self.restore(origin)
+        self.reset_pending()
+        return count
+
+    def count_from(self, limit):
+        self.whole_solve()
+        situation = self.situation()
+        if situation == -1 or not self.check_sudoku():
+            return 0
+        if situation == 1:
+            return 1
+        target = min((cell for cell in self.grid if cell.value == 0), key=lambda x: MASK_COUNT[x.mask])
+        origin = self.snapshot()
+        count = 0
+        for nominee in target.nominees:
+            target.confirm(nominee)
+            self.suppress(target, nominee)
+            count += self.count_from(limit - count)
+            self.restore(origin)
+            if count >= limit:
+                break
+        return count
+
+    # 按照优先级调度各求值方法：每个方法只处理它上次运行以来有变化的 unit ，某个方法运行后回到优先级最高的方法，直到所有方法都没有待处理的 unit
     def whole_solve(self):
-        priority = [self.kill_nominees, self.unique_nominee, self.number_chain, self.y_wing]
-        whole = priority[:-1] + priority[::-1]
-        previous_unsolved = None
-        unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for method in whole:
-                res = method()
-                if res:
+        strategies = [(name, getattr(self, name)) for name in self.STRATEGIES]
+        while self.get_unsolved_count() != 0:
+            for name, method in strategies:
+                if self.handled[name] < len(self.changes):
+                    self.measure(name, method, self.take_pending(name))
                     break
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
+            else:
+                break
 
+    # 用指定的 engine 求解，返回是否得到正确的完整盘面
+    def solve(self, engine='strategy', search=True, time_limit=None):
+        if engine == 'dlx':
+            self.measure('dlx', self.dlx_solve, 1, time_limit)
+        else:
+            self.whole_solve()
+            if self.get_unsolved_count() != 0:
+                self.measure('search' if search else 'attempt', self.attempt, search, time_limit)
+        return self.get_unsolved_count() == 0 and self.check_sudoku()
 
     def show_nominees(self):
         for i in range(9):
@@ -342,44 +654,242 @@ class Sudoku(object):
             print()
 
 
+# 精确覆盖矩阵的模板：0 为 root ，1-324 为约束列（cell、row-数字、column-数字、block-数字各 81 个），之后每 4 个节点为一个候选行（cell × 数字，共 729 行）
+DLX_COLUMNS = 324
+
+def build_dlx_template():
+    left = [i - 1 for i in range(DLX_COLUMNS + 1)]
+    right = [i + 1 for i in range(DLX_COLUMNS + 1)]
+    left[0], right[DLX_COLUMNS] = DLX_COLUMNS, 0
+    up = list(range(DLX_COLUMNS + 1))
+    down = list(range(DLX_COLUMNS + 1))
+    column = list(range(DLX_COLUMNS + 1))
+    row_of = [-1] * (DLX_COLUMNS + 1)
+    size = [0] * (DLX_COLUMNS + 1)
+    for r in range(729):
+        index, digit = divmod(r, 9)
+        row, col = divmod(index, 9)
+        block = (row // 3) * 3 + col // 3
+        first = len(left)
+        for k, c in enumerate([index, 81 + row * 9 + digit, 162 + col * 9 + digit, 243 + block * 9 + digit]):
+            c += 1
+            node = len(left)
+            left.append(first + (k - 1) % 4)
+            right.append(first + (k + 1) % 4)
+            up.append(up[c])
+            down.append(c)
+            down[up[c]] = node
+            up[c] = node
+            column.append(c)
+            row_of.append(r)
+            size[c] += 1
+    return left, right, up, down, column, row_of, size
+
+DLX_TEMPLATE = build_dlx_template()
+
+
+class DancingLinks(object):
+
+    def __init__(self):
+        self.left, self.right, self.up, self.down, self.column, self.row_of, self.size = [list(x) for x in DLX_TEMPLATE]
+
+    def cover(self, c):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        right[left[c]] = right[c]
+        left[right[c]] = left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, c):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = c
+        left[right[c]] = c
+
+    # givens 为 (cell 下标, 数字) 列表，返回找到的解的个数（最多 limit 个）以及第一个解（候选行编号列表）；过了 deadline 就停止搜索，self.timeout 记为 True
+    def solve(self, givens, limit=1, deadline=None):
+        self.timeout = False
+        covered = set()
+        partial = []
+        for index, value in givens:
+            r = index * 9 + value - 1
+            node = DLX_COLUMNS + 1 + r * 4
+            for k in range(4):
+                if self.column[node + k] in covered:
+                    # 已知数之间互相冲突，无解
+                    return 0, None
+                covered.add(self.column[node + k])
+                self.cover(self.column[node + k])
+            partial.append(r)
+        self.count = 0
+        self.first = None
+        self.limit = limit
+        self.deadline = deadline
+        self.search(partial)
+        return self.count, self.first
+
+    def search(self, partial):
+        right, down, size = self.right, self.down, self.size
+        if right[0] == 0:
+            self.count += 1
+            if self.first is None:
+                self.first = list(partial)
+            return self.count >= self.limit
+        if self.deadline is not None and time.time() > self.deadline:
+            self.timeout = True
+            return True
+        # 选择剩余候选行最少的约束列
+        c = right[0]
+        best = c
+        while c != 0:
+            if size[c] < size[best]:
+                best = c
+                if size[c] <= 1:
+                    break
+            c = right[c]
+        if size[best] == 0:
+            return False
+        self.cover(best)
+        r = down[best]
+        done = False
+        while r != best and not done:
+            partial.append(self.row_of[r])
+            j = right[r]
+            while j != r:
+                self.cover(self.column[j])
+                j = right[j]
+            done = self.search(partial)
+            j = self.left[r]
+            while j != r:
+                self.uncover(self.column[j])
+                j = self.left[j]
+            partial.pop()
+            r = down[r]
+        self.uncover(best)
+        return done
+
+
+# cage 的合法分解：(sum, 格数) 对应的所有数字组合掩码，以及这些组合的并集，导入时计算一次
+CAGE_COMBINATIONS = {}
+for mask in range(1, ALL_NOMINEES + 1):
+    CAGE_COMBINATIONS.setdefault((sum(MASK_NOMINEES[mask]), MASK_COUNT[mask]), []).append(mask)
+CAGE_COMBINATIONS = {key: tuple(masks) for key, masks in CAGE_COMBINATIONS.items()}
+CAGE_UNION = {key: reduce(lambda x, y: x | y, masks) for key, masks in CAGE_COMBINATIONS.items()}
+
+# 查询 (total, size) 的合法组合，include 为组合必须包含的数字掩码，exclude 为组合不能包含的数字掩码
+def cage_combinations(total, size, include=0, exclude=0):
+    return [mask for mask in CAGE_COMBINATIONS.get((total, size), ()) if mask & include == include and not mask & exclude]
+
+# 判断 digits 中的数能否一一填入 masks 对应的各个 cell（cell 数与数字个数相同）
+def assignable(masks, digits):
+    if not masks:
+        return digits == 0
+    for value in MASK_NOMINEES[masks[0] & digits]:
+        if assignable(masks[1:], digits & ~bit(value)):
+            return True
+    return False
+
+# 45 法则的区域：相邻的 1-3 个 row 或 column ，单个 block ，以及同一 band/stack 内相邻的 2 个 block ；每项为 (cell 集合, unit 个数)
+# 同一 band/stack 的 3 个 block 与 3 个相邻 row/column 相同，不再重复
+def build_regions():
+    regions = []
+    for unit in ['row', 'column']:
+        for size in range(1, 4):
+            for start in range(10 - size):
+                regions.append((frozenset(index for n in range(start, start + size) for index in UNITS[UNIT_OFFSET[unit] + n]), size))
+    for n in range(9):
+        block = frozenset(UNITS[UNIT_OFFSET['block'] + n])
+        regions.append((block, 1))
+        if n % 3 < 2:
+            regions.append((block | frozenset(UNITS[UNIT_OFFSET['block'] + n + 1]), 2))
+        if n < 6:
+            regions.append((block | frozenset(UNITS[UNIT_OFFSET['block'] + n + 3]), 2))
+    return tuple(regions)
+
+REGIONS = build_regions()
+
+
 class Killer(Sudoku):
     
-    def read_resolve(self):
-        with open('resolve') as f:
-            raw_resolve = f.readlines()
-        resolve = {}
-        for line in raw_resolve:
-            resolve_list = list(map(lambda x: int(x), line.strip().split(',')))
-            sums, counts = sum(list(map(lambda x: int(x), resolve_list))), len(resolve_list)
-            if (sums, counts) in resolve.keys():
-                resolve[(sums, counts)].append(set(resolve_list))
-            else:
-                resolve[(sums, counts)] = [set(resolve_list)]
-        return resolve
-
+    # cage 布局格式不对时抛出 ValueError
     def read_sudoku(self, filename):
-        numbers = [0] * 81
         with open(filename) as f:
-            # 不知道为什么用 '\d{1,2}{\d{1,2}(,\d{1,2})*}' 这个正则无法识别。。。因此只能退而求其次用以下这几行。。。
-            raw_cages = f.read().replace('}', '}|')[:-2].split('|')
+            text = f.read()
+        try:
+            self.read_cages(text)
+        except (IndexError, KeyError):
+            raise ValueError('Invalid cage layout')
+
+    # 读入 cage 布局，格式为若干个 sum{列行,列行,...} 依次连接
+    def read_cages(self, text):
+        # 不知道为什么用 '\d{1,2}{\d{1,2}(,\d{1,2})*}' 这个正则无法识别。。。因此只能退而求其次用以下这几行。。。
+        raw_cages = text.strip().replace('}', '}|')[:-1].split('|')
         self.cages = list(map(lambda x: {
                 'sum': int(x.split('{')[0]),
                 'member': list(map(lambda y: self.cells[(int(y[1]) - 1, int(y[0]) - 1)], x.replace('}', '').split('{')[1].split(',')))
             }, raw_cages))
-        for row in range(9):
-            for column in range(9):
-                for cage in self.cages:
-                    if self.cells[(row, column)] in cage['member']:
-                        self.cells[(row, column)].cage = self.cages.index(cage)
-        self.resolve = self.read_resolve()
+        for index, cage in enumerate(self.cages):
+            for member in cage['member']:
+                member.cage = index
+        # 在 row/column/block 之后追加 cage 作为 unit ，同一 cage 的 cell 互为 peer
+        self.units = UNITS + tuple(tuple(member.index for member in cage['member']) for cage in self.cages)
+        self.cell_units = tuple(CELL_UNITS[cell.index] + ((UNIT_OFFSET['cage'] + cell.cage,) if cell.cage != -1 else ()) for cell in self.grid)
+        self.peers = tuple(tuple(sorted(set(x for u in self.cell_units[index] for x in self.units[u]) - {index})) for index in range(81))
+        self.state.extend([0] * len(self.cages))
+        self.reset_pending()
+        self.build_region_sums()
+
+    # 每个盘面读入时算一次各区域的 innie 和 outie ，得到 (cell 列表, 这些 cell 之和)：
+    # 区域内不属于完全在区域内的 cage 的 cell （innie）之和为 45k 减去这些 cage 的 sum ，
+    # 与区域相交的 cage 在区域外的 cell （outie）之和为这些 cage 的 sum 减去 45k
+    def build_region_sums(self):
+        region_sums = {}
+        for cells, size in REGIONS:
+            cages = set(self.grid[index].cage for index in cells)
+            inside = [cage for cage in cages if cage != -1 and cells.issuperset(self.units[UNIT_OFFSET['cage'] + cage])]
+            innies = tuple(sorted(cells.difference(*(self.units[UNIT_OFFSET['cage'] + cage] for cage in inside))))
+            if innies:
+                region_sums[innies] = 45 * size - sum(self.cages[cage]['sum'] for cage in inside)
+            if -1 not in cages:
+                outies = tuple(sorted(set(index for cage in cages for index in self.units[UNIT_OFFSET['cage'] + cage]) - cells))
+                if outies:
+                    region_sums[outies] = sum(self.cages[cage]['sum'] for cage in cages) - 45 * size
+        self.region_sums = list(region_sums.items())
  
-    # 重写 Sudoku.suppress() ，当一个 cell 确定后，必须调用此方法，去除与该 cell 同一 row/column/block/cage 的其它 cell 的候选数
-    def suppress(self, cell, value):
-        for row in range(9):
-            for column in range(9):
-                if row == cell.row or column == cell.column or self.cells[(row, column)].block == cell.block or self.cells[(row, column)].cage == cell.cage:
-                    if value in self.cells[(row, column)].nominees:
-                        self.cells[(row, column)].nominees.remove(value)
+    # 填入由 sum 推算出的数；盘面有矛盾时推算结果可能不在 1-9 之内或者不是该 cell 的候选数，这时清空候选数让 situation() 发现矛盾
+    def fill(self, cell, value):
+        if 1 <= value <= 9 and cell.mask & bit(value):
+            cell.confirm(value)
+            self.suppress(cell, value)
+        else:
+            self.eliminate(cell.index, ALL_NOMINEES)
+
+    # 除了 row/column/block ，还要检查每个 cage 内没有重复数、已填入的数之和不超过 sum ，填满时恰好等于 sum
+    def check_sudoku(self):
+        if not Sudoku.check_sudoku(self):
+            return False
+        for cage in self.cages:
+            values = [cell.value for cell in cage['member'] if cell.value != 0]
+            if len(set(values)) != len(values) or sum(values) > cage['sum']:
+                return False
+            if len(values) == len(cage['member']) and sum(values) != cage['sum']:
+                return False
+        return True
 
     # （该方法入循环）如果某个 cage 的 member 只含有一个空 cell ，那么这个空 cell 可以直接填入
     def one_member(self):
@@ -391,98 +901,477 @@ class Killer(Sudoku):
                 if len(empty_cells) == 1:
                     if len(cage['member']) == 1:
                     # 这个 cage 本身就只有一个 member ，直接把 sum 填入
-                        cage['member'][0].confirm(cage['sum'])
-                        self.suppress(cage['member'][0], cage['sum'])
+                        self.fill(cage['member'][0], cage['sum'])
                     else:
                     # 这个 cage 本身不止一个 member ，需要用 sum 和已有数字计算差值后填入
                         to_fill = cage['sum'] - sum(list(map(lambda x: x.value, cage['member'])))
-                        empty_cells[0].confirm(to_fill)
-                        self.suppress(empty_cells[0], to_fill)
+                        self.fill(empty_cells[0], to_fill)
             previous_unsolved = unsolved
             unsolved = self.get_unsolved_count()
 
     # （该方法入循环）将每个 cage 里面的每个 cell 不符合合法分解的候选数去除
     def sweep(self):
         for cage in self.cages:
-            possible_nominees = reduce(lambda x, y: x | y, self.resolve[cage['sum'], len(cage['member'])])
+            possible_mask = CAGE_UNION.get((cage['sum'], len(cage['member'])), 0)
             for cell in cage['member']:
-                if len(cell.nominees) > len(possible_nominees):
-                    self.cells[(cell.row, cell.column)].nominees = list(possible_nominees)
-                # 至此可能未完成，需要继续考虑
+                if cell.value == 0:
+                    self.eliminate(cell.index, ~possible_mask & ALL_NOMINEES)
+
+    # （该方法入循环）用 cage 内已填入的数和空 cell 的候选数筛选合法分解：只保留包含已填入的数、剩下的数又能一一填入空 cell 的分解
+    # 不出现在任何剩余分解中的候选数去除；所有剩余分解都包含的数必须出现在空 cell 中，只有一个 cell 能填就直接填入，否则 cage 外能看到所有这些 cell 的 cell 都不能填这个数
+    def cage_filter(self):
+        for index, cage in enumerate(self.cages):
+            empty_cells = [cell for cell in cage['member'] if cell.value == 0]
+            if not empty_cells:
+                continue
+            placed = self.state[PLACED + UNIT_OFFSET['cage'] + index]
+            masks = sorted((cell.mask for cell in empty_cells), key=lambda x: MASK_COUNT[x])
+            possible = 0
+            required = ALL_NOMINEES
+            for combination in cage_combinations(cage['sum'], len(cage['member']), include=placed):
+                rest = combination & ~placed
+                if assignable(masks, rest):
+                    possible |= rest
+                    required &= rest
+            if not possible:
+            # 没有任何分解可用，清空候选数让矛盾暴露出来
+                required = 0
+            for cell in empty_cells:
+                self.eliminate(cell.index, ~possible & ALL_NOMINEES)
+            for value in MASK_NOMINEES[required]:
+                holders = [cell for cell in empty_cells if cell.value == 0 and cell.mask & bit(value)]
+                if len(holders) == 1:
+                    holders[0].confirm(value)
+                    self.suppress(holders[0], value)
+                elif holders:
+                    members = set(self.units[UNIT_OFFSET['cage'] + index])
+                    for peer in set.intersection(*(set(PEERS[cell.index]) for cell in holders)) - members:
+                        self.eliminate(peer, bit(value))
 
-    # （该方法入循环）如果某个 row/column/block 所包含的 cage 中有且仅有一个空 cell 在该 row/column/block 之外，则这个空 cell 应填入的数为这些 cage 在 row/column/block 以内的 cell 的 sum 与45之差
+    # （该方法入循环）45 法则：某组 innie 或 outie 只剩一个空 cell 时直接填入，剩两个空 cell 时只保留能凑成剩余之和的候选数
     def outer_cell(self):
-        previous_unsolved = None
-        unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
-            for i in range(9):
-                for unit in ['row', 'column', 'block']:
-                    target_unit_cells = self.get_cells_by(unit, i)
-                    related_cages = reduce(lambda x, y: x if y in x else x + [y], [[], ] + list(map(lambda x: self.cages[x.cage], target_unit_cells)))
-                    related_cells = list(filter(lambda y: y, [x for j in list(map(lambda x: x['member'], related_cages)) for x in j]))
-                    outer = list(filter(lambda x: x.value == 0 and x not in target_unit_cells, related_cells))
-                    if len(outer) == 1:
-                    # 有时候某个 row/column/block 会有多个 cell 在外面，但其中只有一个 cell 是空的，在减45的时候不能忽略在 row/column/block 外面但非空的 cell
-                        outer_filled = sum(list(map(lambda y: y.value, list(filter(lambda x: x.value != 0 and x not in target_unit_cells, related_cells)))))
-                        outer_diff = sum(list(map(lambda x: x['sum'], related_cages))) - outer_filled - 45
-                        self.cells[(outer[0].row, outer[0].column)].confirm(outer_diff)
-                        self.suppress(self.cells[(outer[0].row, outer[0].column)], outer_diff)
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()
-     
-    # 按照优先级，往复遍历一次所有求值方法
+        for cells, total in self.region_sums:
+            empty_cells = [self.grid[index] for index in cells if self.state[VALUE + index] == 0]
+            if not 0 < len(empty_cells) <= 2:
+                continue
+            rest = total - sum(self.state[VALUE + index] for index in cells)
+            if len(empty_cells) == 1:
+                self.fill(empty_cells[0], rest)
+            else:
+                self.pair_sum(empty_cells[0], empty_cells[1], rest)
+
+    # 两个空 cell 之和为 total ：每个 cell 只保留另一个 cell 有对应候选数的候选数，两个 cell 互为 peer 时不能填相同的数
+    def pair_sum(self, first, second, total):
+        distinct = second.index in self.peers[first.index]
+        for this, other in [(first, second), (second, first)]:
+            keep = 0
+            for value in MASK_NOMINEES[this.mask]:
+                if 1 <= total - value <= 9 and other.mask & bit(total - value) and not (distinct and total - value == value):
+                    keep |= bit(value)
+            self.eliminate(this.index, ~keep & ALL_NOMINEES)
+
+    # 按照优先级，往复遍历所有求值方法，直到数字和候选数都不再变化
     def k_whole_solve(self):
-        priority = [self.sweep, self.one_member, self.outer_cell]
+        priority = [self.sweep, self.cage_filter, self.one_member, self.outer_cell]
         whole = priority[:-1] + priority[::-1]
-        previous_unsolved = None
-        unsolved = self.get_unsolved_count()
-        while(previous_unsolved != unsolved):
+        previous = None
+        while(previous != self.state[:DIGIT_ROW]):
+            previous = self.state[:DIGIT_ROW]
             for method in whole:
-                res = method()
+                res = self.measure(method.__name__, method)
                 if res:
                     break
-            previous_unsolved = unsolved
-            unsolved = self.get_unsolved_count()       
 
+    # classic 与 cage 的求值方法交替运行，直到数字和候选数都不再变化；attempt() 和 search() 的每个节点也都通过它推理
+    def whole_solve(self):
+        previous = None
+        while(previous != self.state[:DIGIT_ROW] and self.get_unsolved_count() != 0):
+            previous = self.state[:DIGIT_ROW]
+            Sudoku.whole_solve(self)
+            self.k_whole_solve()
+
+    # Dancing Links 不处理 cage 的 sum ，Killer 总是先推理再回溯搜索
+    def solve(self, engine='strategy', search=True, time_limit=None):
+        return Sudoku.solve(self, 'strategy', search, time_limit)
 
-def run(filename):
-    s = Sudoku()
-    s.read_sudoku(filename)
-    s.whole_solve()
-    if not s.check_sudoku():
-        s.attempt()
+    def count_solutions(self, limit=2, engine='strategy'):
+        return Sudoku.count_solutions(self, limit, 'strategy')
+
+
+ENGINES = ['strategy', 'dlx']
+
+# cache 不为 None 时先查找等价盘面的解，求解成功后再记入缓存；Killer 不使用缓存。solutions 不为 None 时把 (盘面, 解) 加入其中
+# 文件读不了或格式不对时报告为未解出，不中断整批求解
+def run(filename, search=True, time_limit=None, engine='strategy', reports=None, killer=False, cache=None, solutions=None):
+    s = Killer() if killer else Sudoku()
+    try:
+        s.read_sudoku(filename)
+    except (OSError, ValueError) as e:
+        print()
+        print('Cannot read "{filename}": {0}'.format(e, filename=filename))
+        print()
+        if reports is not None:
+            reports.append(s.report())
+        if solutions is not None:
+            solutions.append((None, None))
+        return False
+    puzzle = s.plain_sudoku()
+    solution = None if killer or cache is None else cache.lookup(puzzle)
+    if solution is not None:
+        s.fill_solution(solution)
+        result = s.get_unsolved_count() == 0 and s.check_sudoku()
+    else:
+        result = s.solve(engine, search, time_limit)
+        if result and cache is not None and not killer:
+            cache.save(puzzle, s.plain_sudoku())
     print()
-    print('Solution of "{filename}":'.format(filename=filename))
+    print('Solution of "{filename}"{0}:'.format(' (cached)' if solution is not None else '', filename=filename))
     s.display_sudoku()
+    if s.search_stats['nodes']:
+        print('{0} nodes visited, max depth {1}{2}.'.format(s.search_stats['nodes'], s.search_stats['max_depth'], ', timed out' if s.search_stats['timeout'] else ''))
+    elif s.search_stats['timeout']:
+        print('Timed out.')
     print()
-    if s.check_sudoku():
-        return True
-    return False
+    if reports is not None:
+        reports.append(dict(s.report(), cached=solution is not None))
+    if solutions is not None:
+        solutions.append((puzzle, s.plain_sudoku()))
+    return result
+
+# 把一个盘面的报告累加到 total 中，得到整批的汇总报告
+def merge_report(total, report):
+    total['puzzles'] = total.get('puzzles', 0) + 1
+    total['unsolved'] = total.get('unsolved', 0) + (1 if report['unsolved'] else 0)
+    total['cached'] = total.get('cached', 0) + int(report['cached'])
+    strategies = total.setdefault('strategies', {})
+    for name, record in report['strategies'].items():
+        merged = strategies.setdefault(name, {'calls': 0, 'time': 0.0, 'eliminated': 0, 'placed': 0})
+        for key in merged:
+            merged[key] += record[key]
+    search = total.setdefault('search', {'nodes': 0, 'max_depth': 0, 'timeout': 0})
+    search['nodes'] += report['search']['nodes']
+    search['max_depth'] = max(search['max_depth'], report['search']['max_depth'])
+    search['timeout'] += int(report['search']['timeout'])
+    return total
+
+# 按 key 排序后，key 相同的元素之间所有可能的排列
+def tied_orders(items, key):
+    groups = [list(group) for _, group in itertools.groupby(sorted(items, key=key), key=key)]
+    return [[x for part in parts for x in part] for parts in itertools.product(*(list(itertools.permutations(group)) for group in groups))]
+
+# 行的排列：band 按其中各 row 的 key 排序，band 内的 row 按 key 排序；row 的 key 为提示数个数以及这些提示数所在 column 的提示数个数，与 column 的排列和数字的编号无关
+def row_orders(grid):
+    column_counts = [sum(1 for row in grid if row[c]) for c in range(9)]
+    key = [(sum(1 for v in row if v), sorted(column_counts[c] for c in range(9) if row[c])) for row in grid]
+    bands = tied_orders(range(3), lambda b: sorted(key[b * 3 + i] for i in range(3)))
+    inside = [tied_orders(range(b * 3, b * 3 + 3), lambda r: key[r]) for b in range(3)]
+    return [[r for b in band for r in rows[b]] for band in bands for rows in (dict(zip(range(3), x)) for x in itertools.product(*inside))]
+
+# 等价变换（数字重新编号、band/stack 内外的行列交换、转置）下的规范形式，返回 (规范盘面, 变换)
+# 在每种转置下，行列按与编号无关的 key 排序，只枚举 key 相同的行列之间的排列，数字按出现的先后重新编号，取其中最小的盘面
+# 对称性很高的盘面（例如几乎全空）排列过多，只比较前 CANONICAL_LIMIT 种，得到的仍是一个等价盘面，只是不一定规范
+CANONICAL_LIMIT = 2000
+
+def canonical_form(plain):
+    grid = [[0 if x == '.' else int(x) for x in plain[r * 9:r * 9 + 9]] for r in range(9)]
+    best = None
+    for transpose in [False, True]:
+        g = [list(x) for x in zip(*grid)] if transpose else grid
+        columns_list = row_orders([list(x) for x in zip(*g)])
+        for rows, columns in itertools.islice(itertools.product(row_orders(g), columns_list), CANONICAL_LIMIT):
+            relabel = {0: 0}
+            out = []
+            for r in rows:
+                row = g[r]
+                for c in columns:
+                    v = row[c]
+                    if v not in relabel:
+                        relabel[v] = len(relabel)
+                    out.append(relabel[v])
+            if best is None or out < best[0]:
+                best = (out, (transpose, rows, columns, relabel))
+    out, (transpose, rows, columns, relabel) = best
+    # 没有出现的数字按大小接着编号，保证编号是 1-9 的一一对应
+    for v in range(1, 10):
+        if v not in relabel:
+            relabel[v] = len(relabel)
+    return ''.join(map(str, out)), (transpose, rows, columns, relabel)
+
+# 把原方向的盘面（例如它的解）按 transform 变换到规范方向
+def transform_grid(plain, transform):
+    transpose, rows, columns, relabel = transform
+    grid = [plain[r * 9:r * 9 + 9] for r in range(9)]
+    if transpose:
+        grid = [''.join(x) for x in zip(*grid)]
+    return ''.join(str(relabel[int(grid[r][c])]) for r in rows for c in columns)
+
+# transform_grid() 的逆变换：把规范方向的盘面变换回原方向
+def restore_grid(plain, transform):
+    transpose, rows, columns, relabel = transform
+    inverse = {label: v for v, label in relabel.items()}
+    grid = [[0] * 9 for _ in range(9)]
+    for i, r in enumerate(rows):
+        for j, c in enumerate(columns):
+            grid[r][c] = inverse[int(plain[i * 9 + j])]
+    if transpose:
+        grid = [list(x) for x in zip(*grid)]
+    return ''.join(str(v) for row in grid for v in row)
+
+# 以规范盘面为 key 的解的缓存：内存中按 LRU 保留 size 个，filename 不为 None 时同时存入 dbm 文件
+class SolutionCache(object):
+
+    def __init__(self, size=10000, filename=None):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.store = dbm.open(filename, 'c') if filename else None
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries or (self.store is not None and key in self.store)
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.store is not None and key in self.store:
+            solution = self.store[key].decode()
+            self.remember(key, solution)
+            return solution
+        return None
+
+    def put(self, key, solution):
+        self.remember(key, solution)
+        if self.store is not None:
+            self.store[key] = solution
+
+    def remember(self, key, solution):
+        if self.size <= 0:
+            return
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    # 查找某个盘面的解，返回原方向的解或 None
+    def lookup(self, plain):
+        key, transform = canonical_form(plain)
+        solution = self.get(key)
+        if solution is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return restore_grid(solution, transform)
+
+    # 记录某个盘面的解（原方向）
+    def save(self, plain, solution):
+        key, transform = canonical_form(plain)
+        self.put(key, transform_grid(solution, transform))
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+# 逐行读取一个文件中的盘面（每行 81 个字符，'0' 或 '.' 表示空格），以 .gz 结尾的文件按 gzip 解压，use_mmap 为 True 时通过 mmap 读取
+def read_puzzles(filename, use_mmap=False):
+    with open(filename, 'rb') as f:
+        if use_mmap and os.path.getsize(filename) > 0:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            source = f
+        if filename.endswith('.gz'):
+            source = gzip.GzipFile(fileobj=source)
+        for number, line in enumerate(iter(source.readline, b''), 1):
+            plain = line.strip().decode()
+            if not plain:
+                continue
+            if len(plain) != 81 or plain.strip('.0123456789'):
+                print('Invalid sudoku at {0}:{1}'.format(filename, number), file=sys.stderr)
+                continue
+            yield plain
+
+# 逐行写出盘面，filename 为 '-' 时写到 stdout ，以 .gz 结尾的文件按 gzip 压缩
+def write_puzzles(filename, puzzles):
+    if filename == '-':
+        for plain in puzzles:
+            print(plain)
+        return
+    with (gzip.open(filename, 'wt') if filename.endswith('.gz') else open(filename, 'w')) as f:
+        for plain in puzzles:
+            f.write(plain + '\n')
+
+def solve_plain(job):
+    plain, engine, time_limit = job
+    s = Sudoku()
+    s.read_plain(plain)
+    begin_time = time.time()
+    result = s.solve(engine, time_limit=time_limit)
+    end_time = time.time()
+    return s.plain_sudoku(), result, round(end_time - begin_time, 3), s.report()
+
+# 从缓存得到的解的报告：没有调用任何求值方法
+def cached_report():
+    return {'unsolved': 0, 'cached': True, 'strategies': {}, 'search': {'nodes': 0, 'max_depth': 0, 'timeout': False}}
+
+# 依次返回 files 中每个盘面的 (解, result, 耗时, 报告)；jobs 大于 1 时分批交给进程池，内存占用与文件大小无关
+# cache 不为 None 时，缓存中已有等价盘面的直接还原出解，同一批中互相等价的盘面只求解第一个，缓存只在主进程中读写
+def solve_bulk(files, engine='strategy', jobs=1, use_mmap=False, cache=None, time_limit=None):
+    puzzles = ((plain, engine, time_limit) for f in files for plain in read_puzzles(f, use_mmap))
+    with contextlib.ExitStack() as stack:
+        solve = map if jobs <= 1 else stack.enter_context(multiprocessing.Pool(jobs)).imap
+        while True:
+            batch = list(itertools.islice(puzzles, max(jobs, 1) * 64))
+            if not batch:
+                break
+            if cache is None:
+                for solution in solve(solve_plain, batch):
+                    yield solution
+                continue
+            forms = [canonical_form(plain) for plain, _, _ in batch]
+            first = {}
+            for position, (key, transform) in enumerate(forms):
+                if key not in first and key not in cache:
+                    first[key] = position
+            todo = sorted(first.values())
+            solved = dict(zip(todo, solve(solve_plain, [batch[position] for position in todo])))
+            for position, (key, transform) in enumerate(forms):
+                if position in solved:
+                    solution, result, elapsed, report = solved[position]
+                    if result:
+                        cache.put(key, transform_grid(solution, transform))
+                    cache.misses += 1
+                    yield solved[position]
+                elif key in cache:
+                    cache.hits += 1
+                    yield restore_grid(cache.get(key), transform), True, 0.0, cached_report()
+                else:
+                    # 同一批中等价的第一个盘面没有解出，这个盘面单独求解
+                    cache.misses += 1
+                    yield solve_plain(batch[position])
+
+# 在子进程中求解一个文件，把 run() 的输出收集起来交给主进程按原顺序打印
+def timed_run(job, cache=None):
+    index, filename, engine, killer, time_limit = job
+    output = io.StringIO()
+    reports = []
+    solutions = []
+    with contextlib.redirect_stdout(output):
+        begin_time = time.time()
+        result = run(filename, time_limit=time_limit, engine=engine, reports=reports, killer=killer, cache=cache, solutions=solutions)
+        end_time = time.time()
+    return index, result, round(end_time - begin_time, 3), output.getvalue(), reports[0], solutions[0]
+
+# 依次返回每个文件的 (filename, result, 耗时, 报告)；killer 为 True 时文件为 Killer 的 cage 布局；jobs 大于 1 时用进程池并行求解，每完成一个就在 stderr 报告进度，最后仍按输入顺序输出
+# jobs 大于 1 时缓存只在主进程中读写：缓存中已有解的文件直接在主进程中处理，子进程解出的解再由主进程记入缓存
+def solve_files(files, engine='strategy', jobs=1, killer=False, cache=None, time_limit=None):
+    if jobs <= 1:
+        for f in files:
+            reports = []
+            begin_time = time.time()
+            result = run(f, time_limit=time_limit, engine=engine, reports=reports, killer=killer, cache=cache)
+            end_time = time.time()
+            yield f, result, round(end_time - begin_time, 3), reports[0]
+        return
+    finished = [None] * len(files)
+    todo = []
+    for i, f in enumerate(files):
+        if cache is not None and not killer:
+            s = Sudoku()
+            try:
+                s.read_sudoku(f)
+            except (OSError, ValueError):
+                # 交给子进程中的 run() 报告
+                todo.append((i, f, engine, killer, time_limit))
+                continue
+            if s.canonical()[0] in cache:
+                finished[i] = timed_run((i, f, engine, killer, time_limit), cache)[1:5]
+                continue
+        todo.append((i, f, engine, killer, time_limit))
+    with multiprocessing.Pool(jobs) as pool:
+        for done, (index, result, elapsed, output, report, (puzzle, solution)) in enumerate(pool.imap_unordered(timed_run, todo), len(files) - len(todo) + 1):
+            finished[index] = (result, elapsed, output, report)
+            if result and cache is not None and not killer:
+                cache.save(puzzle, solution)
+            print('[{0}/{1}] {2}: {3} in {4} s'.format(done, len(files), files[index], 'solved' if result else 'timed out' if report['search']['timeout'] else 'unsolved', elapsed), file=sys.stderr)
+    for f, (result, elapsed, output, report) in zip(files, finished):
+        print(output, end='')
+        yield f, result, elapsed, report
 
 if __name__ == '__main__':
-    k = Killer()
-    k.read_sudoku('eee')
-    k.k_whole_solve()
-    k.whole_solve()
-    k.display_sudoku()
-    exit()
-
-    if len(sys.argv) > 1:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--engine', choices=ENGINES, default='strategy')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--bulk', action='store_true', help='files contain one 81-character puzzle per line')
+    parser.add_argument('--mmap', action='store_true', help='read bulk files through mmap')
+    parser.add_argument('--output', default='-', help='where to write bulk solutions')
+    parser.add_argument('--killer', action='store_true', help='files contain Killer cage layouts')
+    parser.add_argument('--cache', help='dbm file that keeps solutions across runs')
+    parser.add_argument('--cache-size', type=int, default=0, help='solutions kept in memory; the cache is off unless this or --cache is given')
+    parser.add_argument('--time-limit', type=float, help='seconds allowed per puzzle before the search gives up')
+    parser.add_argument('--profile', help='write a JSON report of per-strategy calls, time, eliminations and placements (aggregate only in --bulk mode)')
+    args = parser.parse_args()
+
+    profile = {'total': {}}
+    cache = SolutionCache(args.cache_size, args.cache) if args.cache_size > 0 or args.cache else None
+    if args.killer and args.bulk:
+        parser.error('--killer cannot be combined with --bulk')
+    if args.bulk:
+        summary = {'count': 0, 'solved': 0, 'timeout': 0, 'timed': 0, 'min': None, 'max': None, 'tot': 0}
+        def solutions():
+            for plain, result, elapsed, report in solve_bulk(args.files, args.engine, args.jobs, args.mmap, cache, args.time_limit):
+                merge_report(profile['total'], report)
+                summary['count'] += 1
+                summary['timeout'] += int(not result and report['search']['timeout'])
+                # 从缓存得到的解不计入耗时统计
+                if result and report['cached']:
+                    summary['solved'] += 1
+                elif result:
+                    summary['solved'] += 1
+                    summary['timed'] += 1
+                    summary['min'] = elapsed if summary['min'] is None else min(summary['min'], elapsed)
+                    summary['max'] = elapsed if summary['max'] is None else max(summary['max'], elapsed)
+                    summary['tot'] += elapsed
+                yield plain
+        write_puzzles(args.output, solutions())
+        if summary['timed']:
+            print('min/max/avg/tot = {0}/{1}/{2}/{3} s'.format(summary['min'], summary['max'], round(summary['tot'] / summary['timed'], 3), round(summary['tot'], 3)), file=sys.stderr)
+        print('{0}/{1} Sudokus solved{2}.'.format(summary['solved'], summary['count'], ', {0} timed out'.format(summary['timeout']) if summary['timeout'] else ''), file=sys.stderr)
+    elif args.files:
         times = []
         unsolved = []
+        timed_out = []
         finish_count = 0
-        for f in sys.argv[1:]:
-            begin_time = time.time()
-            result = run(f)
-            end_time = time.time()
+        profile['puzzles'] = []
+        for f, result, elapsed, report in solve_files(args.files, args.engine, args.jobs, args.killer, cache, args.time_limit):
+            merge_report(profile['total'], report)
+            report.update(file=f, elapsed=elapsed)
+            profile['puzzles'].append(report)
             if result:
                 finish_count += 1
-                times.append(round(end_time - begin_time, 3))
+                # 从缓存得到的解不计入耗时统计
+                if not report['cached']:
+                    times.append(elapsed)
+            elif report['search']['timeout']:
+                timed_out.append(f)
             else:
                 unsolved.append(f)
-        print('min/max/avg/tot = {0}/{1}/{2}/{3} s'.format(min(times), max(times), round(sum(times) / len(times), 3), round(sum(times), 3)))
-        print('{0}/{1} Sudokus solved.'.format(finish_count, len(sys.argv) - 1))
+        if times:
+            print('min/max/avg/tot = {0}/{1}/{2}/{3} s'.format(min(times), max(times), round(sum(times) / len(times), 3), round(sum(times), 3)))
+        print('{0}/{1} Sudokus solved{2}.'.format(finish_count, len(args.files), ', {0} timed out'.format(len(timed_out)) if timed_out else ''))
         if unsolved:
             print('Unsolved sudoku(s):{0}'.format(unsolved))
+        if timed_out:
+            print('Timed out sudoku(s):{0}'.format(timed_out))
     else:
-        run('aaa')
+        profile['puzzles'] = []
+        run('aaa', time_limit=args.time_limit, engine=args.engine, reports=profile['puzzles'], cache=cache)
+        merge_report(profile['total'], profile['puzzles'][0])
+    if cache is not None:
+        if cache.hits:
+            print('{0} of {1} puzzles answered from the solution cache.'.format(cache.hits, cache.hits + cache.misses), file=sys.stderr)
+        cache.close()
+    if args.profile:
+        with open(args.profile, 'w') as f:
+            json.dump(profile, f, indent=2)